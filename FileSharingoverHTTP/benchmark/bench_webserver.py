@@ -0,0 +1,520 @@
+# utf-8
+# description: WebServer 基准测试：生成共享目录，在本机启动服务并施加并发负载，输出JSON结果
+# language: python
+#
+# 用法（在 FileSharingoverHTTP 目录下）：
+#   python benchmark/bench_webserver.py --output result.json
+#   python benchmark/bench_webserver.py -w small,list_wide -c 16 --engine asyncio
+#   python benchmark/bench_webserver.py --compare result.json
+#   python benchmark/bench_webserver.py --compare benchmark/baseline.json   # 与仓库中记录的基线对比
+#   python benchmark/bench_webserver.py --check          # 回归检查，失败时退出码非0
+#
+# 服务在子进程中运行，峰值内存只统计服务端；每个负载使用新的服务进程，
+# 峰值内存只反映该负载，与负载的运行顺序无关。
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import quote
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各负载默认请求总数（--requests 可统一覆盖）
+DEFAULT_REQUESTS = {
+    'small': 3000,
+    'large': 20,
+    'list_wide': 200,
+    'list_deep': 1000,
+    'zip': 20,
+    'upload': 300,
+}
+WORKLOADS = list(DEFAULT_REQUESTS)
+READ_CHUNK = 1024 * 1024
+# --check：同一连接上连续请求的次数与中位耗时上限（毫秒），Nagle 与延迟确认叠加时约40ms
+CHECK_KEEPALIVE_REQUESTS = 20
+CHECK_KEEPALIVE_MAX_MS = 20
+# --compare 时吞吐下降超过该百分比的负载标记为回退（单机多次运行间波动可达20%左右）
+COMPARE_REGRESSION_PCT = 50
+# 目录列表缓存有效期为5秒（LIST_CACHE_TTL），检查服务外改动前需等待其过期
+CHECK_LIST_CACHE_WAIT = 6
+
+def peak_rss_kb():
+    # 当前进程峰值常驻内存（KB），平台不支持时返回None
+    # Linux 的 ru_maxrss 跨 execve 保留，会带上父进程（基准测试进程）的峰值，优先读取 VmHWM
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) // 1024
+    except ImportError:
+        return None
+
+def serve(overrides):
+    """
+    子进程入口：启动服务，输出 READY 行后按标准输入命令工作。
+    rss -> 输出峰值内存；stop 或输入关闭 -> 停止服务并退出。
+    """
+    sys.path.insert(0, BASE_DIR)
+    from webserver import webserver
+    webserver.start_server(overrides)
+    for _ in range(100):
+        if webserver._httpd is not None:
+            break
+        time.sleep(0.05)
+    else:
+        print(json.dumps({'error': '服务启动失败', 'log': webserver.get_log()[-5:]}), flush=True)
+        return
+    cfg = webserver.load_config()
+    cfg.update(overrides)
+    cfg.pop('password', None)
+    print(json.dumps({'ready': True, 'config': cfg}), flush=True)
+    for line in sys.stdin:
+        if line.strip() == 'rss':
+            print(json.dumps({'peak_rss_kb': peak_rss_kb()}), flush=True)
+        else:
+            break
+    webserver.force_stop_server()
+
+class ServerProcess:
+    """在子进程中运行 webserver.start_server"""
+    def __init__(self, overrides):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', json.dumps(overrides)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8')
+        info = self._read()
+        if not info.get('ready'):
+            self.stop()
+            raise RuntimeError(f"服务启动失败: {info}")
+        self.config = info['config']
+
+    def _read(self):
+        line = self.proc.stdout.readline()
+        return json.loads(line) if line else {}
+
+    def peak_rss_kb(self):
+        self.proc.stdin.write('rss\n')
+        self.proc.stdin.flush()
+        return self._read().get('peak_rss_kb')
+
+    def stop(self):
+        try:
+            self.proc.stdin.write('stop\n')
+            self.proc.stdin.flush()
+        except (OSError, ValueError):
+            pass
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def build_tree(root, args):
+    """
+    生成测试目录（内容由 --seed 决定，多次运行完全一致）：
+    small/ 小文件，large.bin 大文件，wide/ 宽目录，deep/ 深目录，zipme/ 打包目录，uploads/ 上传目标
+    """
+    rnd = random.Random(args.seed)
+    text = ('The quick brown fox jumps over the lazy dog. ' * 64).encode()
+
+    def payload(size, compressible):
+        if compressible:
+            return (text * (size // len(text) + 1))[:size]
+        return rnd.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+    os.makedirs(os.path.join(root, 'small'))
+    for i in range(args.small_files):
+        with open(os.path.join(root, 'small', f'f{i:05d}.txt'), 'wb') as f:
+            f.write(payload(args.small_size, True))
+    with open(os.path.join(root, 'large.bin'), 'wb') as f:
+        block = payload(READ_CHUNK, False)
+        for _ in range(args.large_mb):
+            f.write(block)
+    os.makedirs(os.path.join(root, 'wide'))
+    for i in range(args.wide_entries):
+        if i % 10 == 0:
+            os.mkdir(os.path.join(root, 'wide', f'dir{i:06d}'))
+        else:
+            with open(os.path.join(root, 'wide', f'file{i:06d}.dat'), 'wb') as f:
+                f.write(payload(rnd.randint(0, 4096), True))
+    deep = os.path.join(root, 'deep')
+    for level in range(args.deep_levels):
+        deep = os.path.join(deep, f'level{level:02d}')
+        os.makedirs(deep)
+        for i in range(args.deep_files):
+            with open(os.path.join(deep, f'item{i:03d}.txt'), 'wb') as f:
+                f.write(payload(1024, True))
+    os.makedirs(os.path.join(root, 'zipme'))
+    for i in range(args.zip_files):
+        sub = os.path.join(root, 'zipme', f'part{i % 8}')
+        os.makedirs(sub, exist_ok=True)
+        # 文本与随机数据各半，覆盖压缩与存储两种路径
+        with open(os.path.join(sub, f'z{i:04d}.{"txt" if i % 2 else "bin"}'), 'wb') as f:
+            f.write(payload(args.zip_size, i % 2 == 1))
+    os.makedirs(os.path.join(root, 'uploads'))
+
+def make_requests(workload, args, worker):
+    """返回 生成第n个请求 的函数：n -> (method, path, body, headers)"""
+    rnd = random.Random(args.seed * 1000 + worker)
+    if workload == 'small':
+        return lambda n: ('GET', f'/small/f{rnd.randrange(args.small_files):05d}.txt', None, {})
+    if workload == 'large':
+        return lambda n: ('GET', '/large.bin', None, {})
+    if workload == 'list_wide':
+        return lambda n: ('GET', '/list?dir=wide', None, {})
+    if workload == 'list_deep':
+        paths = []
+        rel = 'deep'
+        for level in range(args.deep_levels):
+            rel += f'/level{level:02d}'
+            paths.append('/list?dir=' + quote(rel, safe=''))
+        return lambda n: ('GET', rnd.choice(paths), None, {})
+    if workload == 'zip':
+        return lambda n: ('GET', '/zipme.zip', None, {})
+    if workload == 'upload':
+        boundary = 'benchboundary7d1c'
+        data = random.Random(args.seed).getrandbits(args.upload_kb * 8192).to_bytes(args.upload_kb * 1024, 'little')
+
+        def upload(n):
+            head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                    f'filename="w{worker:02d}_{n:06d}.bin"\r\nContent-Type: application/octet-stream\r\n\r\n').encode()
+            body = head + data + f'\r\n--{boundary}--\r\n'.encode()
+            return ('POST', '/upload?dir=uploads', body,
+                    {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        return upload
+    raise ValueError(workload)
+
+def run_workload(workload, port, args):
+    total = args.requests or DEFAULT_REQUESTS[workload]
+    concurrency = max(1, min(args.concurrency, total))
+    latencies = []
+    errors = []
+    received = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(index, count, record):
+        make = make_requests(workload, args, index)
+        conn = None
+        n = -1
+        while True:
+            # count为None时从共享计数器领取编号，保证请求总数精确
+            n = next(counter, None) if count is None else n + 1
+            if n is None or (count is not None and n >= count):
+                break
+            method, path, body, headers = make(n)
+            begin = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=args.timeout)
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                size = 0
+                while True:
+                    chunk = resp.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                elapsed = time.perf_counter() - begin
+                if resp.will_close:
+                    conn.close()
+                    conn = None
+                if not record:
+                    continue
+                with lock:
+                    if resp.status >= 400:
+                        errors.append(f'HTTP {resp.status}')
+                    else:
+                        latencies.append(elapsed)
+                        received[0] += size
+            except (OSError, http.client.HTTPException) as e:
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                if record:
+                    with lock:
+                        errors.append(type(e).__name__)
+        if conn is not None:
+            conn.close()
+
+    # 预热：不计入结果
+    if args.warmup:
+        warm = [threading.Thread(target=worker, args=(i, args.warmup, False)) for i in range(concurrency)]
+        for t in warm:
+            t.start()
+        for t in warm:
+            t.join()
+
+    threads = [threading.Thread(target=worker, args=(i, None, True)) for i in range(concurrency)]
+    begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - begin
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 3)
+
+    return {
+        'workload': workload,
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'error_kinds': sorted(set(errors)),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 2) if duration else None,
+        'throughput_mib_s': round(received[0] / duration / 1024 / 1024, 2) if duration else None,
+        'bytes_received': received[0],
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+            'p50': pct(50),
+            'p90': pct(90),
+            'p99': pct(99),
+            'max': round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+    }
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare(old, new):
+    # 对比两次结果：吞吐与p99的变化百分比，吞吐明显下降的负载标记为回退
+    old_results = {r['workload']: r for r in old.get('results', [])}
+    lines = [f"{'workload':<12}{'rps old':>12}{'rps new':>12}{'change':>9}{'p99 old':>11}{'p99 new':>11}{'change':>9}"]
+    regressed = []
+
+    def change(a, b):
+        return f'{(b - a) / a * 100:+.1f}%' if a and b is not None else '-'
+    for r in new['results']:
+        o = old_results.get(r['workload'])
+        if o is None:
+            continue
+        op99, np99 = o['latency_ms']['p99'], r['latency_ms']['p99']
+        ops, nps = o['throughput_rps'], r['throughput_rps']
+        mark = ''
+        if ops and nps is not None and (ops - nps) / ops * 100 > COMPARE_REGRESSION_PCT:
+            mark = '  回退'
+            regressed.append(r['workload'])
+        lines.append(f"{r['workload']:<12}{ops or 0:>12.1f}{nps or 0:>12.1f}{change(ops, nps):>9}"
+                     f"{op99 or 0:>11.2f}{np99 or 0:>11.2f}{change(op99, np99):>9}{mark}")
+    if regressed:
+        lines.append(f"吞吐下降超过 {COMPARE_REGRESSION_PCT}%: {', '.join(regressed)}")
+    return '\n'.join(lines)
+
+def check_keepalive(port, share_dir):
+    """同一长连接上连续请求小文件，每个请求不应被 Nagle/延迟确认拖慢"""
+    with open(os.path.join(share_dir, 'check.txt'), 'wb') as f:
+        f.write(b'x' * 1024)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    times = []
+    try:
+        for _ in range(CHECK_KEEPALIVE_REQUESTS):
+            begin = time.perf_counter()
+            conn.request('GET', '/check.txt')
+            resp = conn.getresponse()
+            resp.read()
+            times.append(time.perf_counter() - begin)
+            if resp.will_close:
+                return True, '服务未启用长连接，跳过'
+    finally:
+        conn.close()
+    median = sorted(times)[len(times) // 2] * 1000
+    return median <= CHECK_KEEPALIVE_MAX_MS, f'{len(times)} 个请求中位 {median:.2f} ms（上限 {CHECK_KEEPALIVE_MAX_MS} ms）'
+
+def check_nested_size(port, share_dir):
+    """在服务外向深层子目录写入文件，上层列表中的文件夹大小应随之更新"""
+    deep = os.path.join(share_dir, 'sub', 'deep')
+    os.makedirs(deep)
+    with open(os.path.join(deep, 'a.bin'), 'wb') as f:
+        f.write(b'x' * 1024)
+
+    def folder_bytes():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request('GET', '/list')
+            items = json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+        return next(item['bytes'] for item in items if item['name'] == 'sub')
+
+    before = folder_bytes()
+    with open(os.path.join(deep, 'b.bin'), 'wb') as f:
+        f.write(b'x' * 1024 * 1024)
+    time.sleep(CHECK_LIST_CACHE_WAIT)
+    after = folder_bytes()
+    expected = 1024 + 1024 * 1024
+    return after == expected, f'sub 写入前 {before} 字节，写入后 {after} 字节（应为 {expected}）'
+
+# --check 的检查项：名称 -> check(port, share_dir)，返回 (是否通过, 说明)
+CHECKS = {
+    'keepalive': check_keepalive,
+    'nested_size': check_nested_size,
+}
+
+def run_checks(overrides):
+    """每项检查使用新的临时共享目录与服务进程，返回失败项数"""
+    failed = 0
+    for name, check in CHECKS.items():
+        share_dir = tempfile.mkdtemp(prefix='fscheck_')
+        port = free_port()
+        try:
+            server = ServerProcess(dict(overrides, dir=share_dir, port=port))
+            try:
+                ok, detail = check(port, share_dir)
+            finally:
+                server.stop()
+        finally:
+            shutil.rmtree(share_dir, ignore_errors=True)
+        print(f"{'通过' if ok else '失败'} {name}: {detail}", file=sys.stderr)
+        failed += not ok
+    return failed
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description='FileSharingoverHTTP WebServer 基准测试')
+    p.add_argument('-w', '--workloads', default=','.join(WORKLOADS),
+                   help=f"逗号分隔，可选: {','.join(WORKLOADS)}")
+    p.add_argument('-c', '--concurrency', type=int, default=8, help='并发连接数')
+    p.add_argument('-n', '--requests', type=int, default=0, help='每个负载的请求总数（默认按负载取值）')
+    p.add_argument('--warmup', type=int, default=2, help='每个连接的预热请求数')
+    p.add_argument('--timeout', type=float, default=60, help='单个请求超时（秒）')
+    p.add_argument('--engine', default=None, help='并发引擎 pool/asyncio/single（默认取配置）')
+    p.add_argument('--workers', type=int, default=None, help='工作线程数（默认取配置）')
+    p.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                   help='额外覆盖的配置项，可重复，如 --set zip_level=0 --set keepalive=0')
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--share-dir', default=None, help='测试目录（默认临时目录，结束后删除）')
+    p.add_argument('--keep', action='store_true', help='保留生成的测试目录')
+    p.add_argument('--small-files', type=int, default=2000)
+    p.add_argument('--small-size', type=int, default=4096, help='小文件大小（字节）')
+    p.add_argument('--large-mb', type=int, default=64)
+    p.add_argument('--wide-entries', type=int, default=20000)
+    p.add_argument('--deep-levels', type=int, default=16)
+    p.add_argument('--deep-files', type=int, default=20)
+    p.add_argument('--zip-files', type=int, default=200)
+    p.add_argument('--zip-size', type=int, default=64 * 1024)
+    p.add_argument('--upload-kb', type=int, default=1024)
+    p.add_argument('-o', '--output', default=None, help='结果JSON文件（默认输出到标准输出）')
+    p.add_argument('--compare', default=None, help='与之前的结果JSON对比')
+    p.add_argument('--check', action='store_true', help='只运行回归检查（长连接延迟等），失败时退出码非0')
+    p.add_argument('--serve', default=None, help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve is not None:
+        serve(json.loads(args.serve))
+        return
+    overrides = {'pw_enabled': '0'}
+    if args.engine:
+        overrides['engine'] = args.engine
+    if args.workers:
+        overrides['workers'] = args.workers
+    for item in args.set:
+        key, _, value = item.partition('=')
+        overrides[key.strip()] = value.strip()
+    if args.check:
+        sys.exit(1 if run_checks(overrides) else 0)
+    workloads = [w.strip() for w in args.workloads.split(',') if w.strip()]
+    unknown = [w for w in workloads if w not in DEFAULT_REQUESTS]
+    if unknown:
+        sys.exit(f"未知负载: {','.join(unknown)}")
+
+    share_dir = args.share_dir or tempfile.mkdtemp(prefix='fsbench_')
+    generated = not os.listdir(share_dir)
+    if generated:
+        print(f"生成测试目录: {share_dir}", file=sys.stderr)
+        t0 = time.perf_counter()
+        build_tree(share_dir, args)
+        print(f"  完成，用时 {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    overrides['dir'] = share_dir
+
+    results = []
+    server_config = None
+    try:
+        for workload in workloads:
+            print(f"运行 {workload} ...", file=sys.stderr)
+            # 峰值内存只增不减，每个负载启动新的服务进程单独统计
+            overrides['port'] = free_port()
+            server = ServerProcess(overrides)
+            try:
+                server_config = server_config or server.config
+                start_rss = server.peak_rss_kb()
+                result = run_workload(workload, overrides['port'], args)
+                result['server_start_rss_kb'] = start_rss
+                result['server_peak_rss_kb'] = server.peak_rss_kb()
+            finally:
+                server.stop()
+            results.append(result)
+            lat = result['latency_ms']
+            print(f"  {result['throughput_rps']} req/s, {result['throughput_mib_s']} MiB/s, "
+                  f"p50 {lat['p50']} ms, p99 {lat['p99']} ms, 错误 {result['errors']}, "
+                  f"峰值内存 {result['server_peak_rss_kb']} KB", file=sys.stderr)
+    finally:
+        if args.share_dir is None and not args.keep:
+            shutil.rmtree(share_dir, ignore_errors=True)
+        else:
+            # 保留目录时清空上传结果，下次运行可直接复用
+            shutil.rmtree(os.path.join(share_dir, 'uploads'), ignore_errors=True)
+            os.makedirs(os.path.join(share_dir, 'uploads'), exist_ok=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('serve', 'output', 'compare', 'check')},
+            'server_config': server_config,
+        },
+        'results': results,
+        'server_peak_rss_kb': max((r['server_peak_rss_kb'] for r in results if r['server_peak_rss_kb'] is not None),
+                                  default=None),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -40,13 +40,29 @@ def ensure_config_file():
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             f.write('dir=\nport=8000\npw_enabled=1\npassword=123456\n')
 
+# 与WebServer共用配置服务：只解析一次、合并写盘；单独运行GUI时退回直接读写文件
+try:
+    from webserver.webserver import config_service
+except ImportError:
+    config_service = None
+
 def save_config(dir_path, port, pw_enabled, password):
     ensure_config_file()
+    if config_service is not None:
+        config_service.update({'dir': dir_path, 'port': port, 'pw_enabled': pw_enabled, 'password': password})
+        return
+    # 保留GUI不管理的其它配置项（如并发引擎参数）
+    extra = {k: v for k, v in load_config().items() if k not in ('dir', 'port', 'pw_enabled', 'password')}
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
         f.write(f'dir={dir_path}\nport={port}\npw_enabled={pw_enabled}\npassword={password}\n')
+        for k, v in extra.items():
+            f.write(f'{k}={v}\n')
 
 def load_config():
     ensure_config_file()
+    if config_service is not None:
+        config_service.reload()
+        return dict(config_service.get())
     result = {'dir':'', 'port':'8000', 'pw_enabled':'1', 'password':'123456'}
     try:
         with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
@@ -683,7 +699,10 @@ class MainApp:
         port = self.start_port.get()
         pw_enabled = '1' if self.enable_password else '0'
         password = self.password_var.get()
-        threading.Thread(target=save_config, args=(dir_path, port, pw_enabled, password), daemon=True).start()
+        if config_service is not None:
+            save_config(dir_path, port, pw_enabled, password)
+        else:
+            threading.Thread(target=save_config, args=(dir_path, port, pw_enabled, password), daemon=True).start()
 
     def log_activity(self, action: str):
         """记录一条GUI操作，格式：时间 操作"""
@@ -7,12 +7,12 @@
 
 import os
 import time
-import datetime
+import queue
 import threading
 import tkinter as tk
 from webserver import webserver
 from guiserver import guiserver
-from webserver.webserver import webserver_log
+from webserver.webserver import webserver_log, config_service
 from guiserver.guiserver import gui_activity_log
 
 global gui_started
@@ -41,6 +41,10 @@ def threading_guiserver():
     root = tk.Tk()
     app = guiserver.MainApp(root)
     global_app = app  # 保存全局app对象
+    # GUI操作日志推送到日志管道（含创建界面期间已记录的）
+    for entry in list(gui_activity_log):
+        log_pipeline.put('GUI', entry)
+    app.on_activity = lambda entry: log_pipeline.put('GUI', entry)
 
     def sync_status():
         global gui_started
@@ -76,81 +80,158 @@ log_dir = get_log_dir()
 # 若不存在则自建
 if not os.path.exists(log_dir):
     os.makedirs(log_dir, exist_ok=True)
-log_filename = f"log{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-log_path = os.path.join(log_dir, log_filename)
 
-# 日志写入整合：同一秒内的日志合并为一行，格式为 [时间] 日志1 | 日志2 | ...
-log_buffer = {}
-log_buffer_lock = threading.Lock()
-
-# 日志写入：每行只写一个操作
-def flush_log_buffer():
-    """定时将缓冲区日志写入文件，每行一个操作"""
-    while True:
-        time.sleep(1)
-        now = int(time.time())
-        to_flush = []
-        with log_buffer_lock:
-            for ts in list(log_buffer.keys()):
-                if ts < now:
-                    to_flush.append(ts)
-            for ts in to_flush:
-                logs = log_buffer.pop(ts)
+# 日志文件：单个文件大小上限（字节），超过或跨天时切换新文件；最多保留的日志文件数
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_KEEP = 30
+# 写入批量：缓冲达到该字节数或距上次刷新超过该秒数时写盘
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 1.0
+
+class LogPipeline:
+    """
+    日志管道：WebServer与GUI产生的日志放入队列，由单个写线程统一处理。
+    - 控制台打印、GUI显示等作为监听者在写线程中依次调用，日志产生后立即送达；
+    - 日志文件保持打开，按缓冲大小或时间批量刷新；
+    - 按大小或日期切换新文件，只保留最近 LOG_FILE_KEEP 个。
+    """
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self._queue = queue.Queue()
+        self._listeners = []
+        self._file = None
+        self._file_date = None
+        self._file_size = 0
+        self._thread = None
+
+    def put(self, source, line):
+        """生产者调用：放入一条日志，不阻塞"""
+        self._queue.put((time.time(), source, line))
+
+    def add_listener(self, callback):
+        """callback(source, line)，在写线程中调用"""
+        self._listeners.append(callback)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        """写入剩余日志并关闭文件"""
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        pending = []
+        pending_bytes = 0
+        last_flush = time.time()
+        while True:
+            timeout = max(0.0, LOG_FLUSH_INTERVAL - (time.time() - last_flush)) if pending else None
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._write(pending)
+                self._close()
+                return
+            if record:
+                ts, source, line = record
+                for callback in self._listeners:
+                    try:
+                        callback(source, line)
+                    except Exception:
+                        pass
                 log_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
-                try:
-                    with open(log_path, "a", encoding="utf-8") as f:
-                        for log in logs:
-                            line = f"[{log_time}] {log}"
-                            f.write(line + "\n")
-                except Exception:
-                    pass
-
-def write_log_to_file(log_line):
-    ts = int(time.time())
-    with log_buffer_lock:
-        if ts not in log_buffer:
-            log_buffer[ts] = []
-        log_buffer[ts].append(log_line)
-
-def print_logs():
-    import time
-    last_web_len = 0
-    last_gui_len = 0
-    while True:
-        # 打印webserver_log新增内容
-        if len(webserver_log) > last_web_len:
-            for line in webserver_log[last_web_len:]:
-                log_line = "[WebServer] " + line
-                if global_app:
-                    global_app.show_log(log_line)
-                print(log_line)
-                write_log_to_file(log_line)
-            last_web_len = len(webserver_log)
-        # 打印gui_activity_log新增内容
-        if len(gui_activity_log) > last_gui_len:
-            for line in gui_activity_log[last_gui_len:]:
-                log_line = "[GUI] " + line
-                if global_app:
-                    global_app.show_log(log_line)
-                # print("[GUI]", line)
-                write_log_to_file(log_line)
-            last_gui_len = len(gui_activity_log)
-        time.sleep(1)
+                text = f"[{log_time}] [{source}] {line}\n"
+                pending.append((ts, text))
+                pending_bytes += len(text)
+            if pending and (pending_bytes >= LOG_FLUSH_BYTES or time.time() - last_flush >= LOG_FLUSH_INTERVAL):
+                self._write(pending)
+                pending = []
+                pending_bytes = 0
+                last_flush = time.time()
+
+    def _write(self, pending):
+        for ts, text in pending:
+            try:
+                self._rotate_if_needed(ts)
+                self._file.write(text)
+                self._file_size += len(text.encode('utf-8'))
+            except Exception:
+                pass
+        try:
+            if self._file:
+                self._file.flush()
+        except Exception:
+            pass
+
+    def _rotate_if_needed(self, ts):
+        date = time.strftime('%Y%m%d', time.localtime(ts))
+        if self._file and self._file_date == date and self._file_size < LOG_FILE_MAX_BYTES:
+            return
+        self._close()
+        stem = f"log{time.strftime('%Y%m%d_%H%M%S', time.localtime(ts))}"
+        path = os.path.join(self.log_dir, stem + '.txt')
+        n = 1
+        while os.path.exists(path):
+            # 同一秒内再次切换，追加序号
+            path = os.path.join(self.log_dir, f"{stem}_{n:03d}.txt")
+            n += 1
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file_date = date
+        self._file_size = 0
+        self._prune()
+
+    def _close(self):
+        if self._file:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _prune(self):
+        # 只保留最近修改的 LOG_FILE_KEEP 个日志文件
+        try:
+            paths = [e.path for e in os.scandir(self.log_dir)
+                     if e.is_file() and e.name.startswith('log') and e.name.endswith('.txt')]
+            paths.sort(key=lambda p: os.stat(p).st_mtime_ns)
+        except OSError:
+            return
+        for path in paths[:-LOG_FILE_KEEP]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# 全局日志管道
+log_pipeline = LogPipeline(log_dir)
+
+def show_log_line(source, line):
+    # 监听者：WebServer日志打印到控制台，所有日志同步到GUI
+    log_line = f"[{source}] {line}"
+    if global_app:
+        global_app.show_log(log_line)
+    if source == 'WebServer':
+        print(log_line)
 
 def sharemain():
-    # 先启动GUI线程
+    # 先启动日志管道：WebServer日志产生时直接推送到管道
+    log_pipeline.add_listener(show_log_line)
+    log_pipeline.start()
+    webserver_log.add_listener(lambda seq, line: log_pipeline.put('WebServer', line))
+    # 启动GUI线程
     th_gui = threading.Thread(target=threading_guiserver, daemon=True)
     th_gui.start()
     # 启动webserver线程（自动根据gui_started控制启停）
     th_web = threading.Thread(target=threading_webserver, daemon=True)
     th_web.start()
-    # 启动日志打印线程
-    th_log = threading.Thread(target=print_logs, daemon=True)
-    th_log.start()
-    # 启动日志缓冲写入线程
-    th_flush = threading.Thread(target=flush_log_buffer, daemon=True)
-    th_flush.start()
     th_gui.join()
+    # 写入尚未保存的配置修改
+    config_service.flush()
+    log_pipeline.stop()
 
 if __name__ == '__main__':
     sharemain()
@@ -9,37 +9,342 @@ import os
 import sys
 import json
 import shutil
+import zlib
+import gzip
+import struct
 import zipfile
+import mimetypes
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.cookies import SimpleCookie, CookieError
 from urllib.parse import urlparse, unquote
-import cgi
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from types import MappingProxyType
 import socket
+import selectors
 import time
+import queue
+import uuid
+import bisect
+import base64
+import heapq
+import hashlib
+import secrets
+import asyncio
+import threading
+try:
+    import brotli  # 可选依赖，未安装时只提供gzip
+except ImportError:
+    brotli = None
+
+# 内存中保留的日志条数，超出后覆盖最旧的日志
+LOG_RING_CAPACITY = 10000
+
+class LogRing:
+    """
+    固定容量的日志环形缓冲区，每条日志带单调递增的序号（从0开始）。
+    读取方记住上次返回的序号，用 read_since 只取其后的新日志，不复制全部历史；
+    也可用 add_listener 注册回调，在日志追加时被推送（回调应尽快返回，如仅放入队列）。
+    """
+    def __init__(self, capacity=LOG_RING_CAPACITY):
+        self._lock = threading.Lock()
+        self._capacity = max(1, capacity)
+        self._items = [None] * self._capacity
+        self._first_seq = 0
+        self._next_seq = 0
+        self._listeners = []
+
+    def append(self, line):
+        """追加一条日志，返回其序号"""
+        with self._lock:
+            seq = self._next_seq
+            self._items[seq % self._capacity] = line
+            self._next_seq = seq + 1
+            self._first_seq = max(self._first_seq, self._next_seq - self._capacity)
+        for callback in self._listeners:
+            try:
+                callback(seq, line)
+            except Exception:
+                pass
+        return seq
 
-# 全局日志变量，供外部查看
-webserver_log = []
+    def add_listener(self, callback):
+        """callback(seq, line)，在追加日志的线程中调用"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def read_since(self, seq, limit=None):
+        """
+        返回 (下次读取用的序号, 序号 >= seq 的日志列表)。
+        seq 对应的日志已被覆盖时从仍保留的最旧一条开始。
+        """
+        with self._lock:
+            end = self._next_seq
+            start = max(seq, self._first_seq)
+            if limit is not None:
+                end = min(end, start + limit)
+            return end, [self._items[i % self._capacity] for i in range(start, end)]
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    def set_capacity(self, capacity):
+        """调整容量，保留最新的日志，序号保持不变"""
+        capacity = max(1, capacity)
+        with self._lock:
+            if capacity == self._capacity:
+                return
+            start = max(self._first_seq, self._next_seq - capacity)
+            kept = [self._items[i % self._capacity] for i in range(start, self._next_seq)]
+            self._capacity = capacity
+            self._items = [None] * capacity
+            for i, line in zip(range(start, self._next_seq), kept):
+                self._items[i % capacity] = line
+            self._first_seq = start
+
+    def snapshot(self):
+        return self.read_since(0)[1]
+
+    def __len__(self):
+        return self._next_seq - self._first_seq
+
+# 全局日志，供外部按序号增量读取
+webserver_log = LogRing()
 # 全局已见客户端IP及最后访问时间映射
 client_last_seen = {}
-# 已登录用户映射：ip -> last_login_timestamp
-logged_in_ips = {}
-# 登录保持时长（秒），10分钟
+# 登录保持时长（秒），10分钟；期间每次访问顺延
 AUTH_TTL = 10 * 60
+# 同时保持的登录会话上限，超出时淘汰最早到期的会话
+SESSION_MAX = 10000
+# 登录会话Cookie名
+SESSION_COOKIE = 'fs_session'
+# 以上共享状态在并发处理请求时统一由该锁保护（日志缓冲区自带锁）
+_state_lock = threading.RLock()
+
+class SessionStore:
+    """
+    登录会话表：随机令牌 -> [到期时间, 客户端IP]，令牌通过Cookie下发。
+    - 查找与续期只读写字典，O(1)；
+    - 到期时间另存于最小堆，每次操作顺带弹出已到期的堆顶，清理开销均摊；
+    - 续期不改堆，堆顶弹出时发现已续期则按新到期时间重新入堆。
+    """
+    def __init__(self, ttl=AUTH_TTL, capacity=SESSION_MAX):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._heap = []  # (到期时间, 令牌)
+
+    def create(self, ip):
+        """新建会话，返回令牌"""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            while len(self._sessions) >= self.capacity:
+                self._pop_oldest()
+            self._sessions[token] = [now + self.ttl, ip]
+            heapq.heappush(self._heap, (now + self.ttl, token))
+        return token
+
+    def touch(self, token):
+        """令牌有效则顺延有效期并返回True"""
+        if not token:
+            return False
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(token)
+            if session is None:
+                return False
+            session[0] = now + self.ttl
+            return True
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def clients(self):
+        """当前有效会话的客户端IP列表（用于日志）"""
+        with self._lock:
+            self._purge(time.time())
+            return sorted({ip for expires, ip in self._sessions.values()})
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._heap.clear()
+
+    def __len__(self):
+        with self._lock:
+            self._purge(time.time())
+            return len(self._sessions)
+
+    def _purge(self, now):
+        # 弹出到期的堆顶；已撤销的直接丢弃，已续期的按新时间重新入堆
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, token = heapq.heappop(heap)
+            session = self._sessions.get(token)
+            if session is None:
+                continue
+            if session[0] <= now:
+                del self._sessions[token]
+            else:
+                heapq.heappush(heap, (session[0], token))
+
+    def _pop_oldest(self):
+        # 容量已满：淘汰最早到期的会话
+        heap = self._heap
+        while heap:
+            expires, token = heapq.heappop(heap)
+            session = self._sessions.get(token)
+            if session is None:
+                continue
+            if session[0] > expires:
+                heapq.heappush(heap, (session[0], token))
+                continue
+            del self._sessions[token]
+            return
+
+# 全局登录会话
+auth_sessions = SessionStore()
+
+# 并发引擎配置：pool（线程池）、asyncio（事件循环+线程池）、single（单线程，原实现）
+SERVER_ENGINE = 'pool'
+# 工作线程数量
+MAX_WORKERS = 16
+# 等待队列长度，队列满时直接返回503
+REQUEST_QUEUE_SIZE = 64
+# 单个请求允许的最大Range段数，超出则忽略Range返回完整内容
+MAX_RANGES = 16
+# 文件发送缓冲区大小
+COPY_BUFSIZE = 1024 * 1024
+# 明文连接是否使用零拷贝 sendfile 发送文件
+USE_SENDFILE = True
+# 文件发送统计日志阈值（字节），小于该值的响应（如图标）不记录
+TRANSFER_LOG_MIN_BYTES = 1024 * 1024
+# HTTP/1.1 长连接：开启后同一TCP连接可连续处理多个请求
+HTTP_KEEP_ALIVE = True
+# 长连接空闲超时（秒），超时未收到新请求则关闭连接
+KEEPALIVE_TIMEOUT = 15
+# 单个连接最多处理的请求数
+KEEPALIVE_MAX_REQUESTS = 100
+# 同时挂起等待下一个请求的空闲连接上限（Windows 的 select 最多监听约512个套接字）
+IDLE_MAX_CONNECTIONS = 500
+# 缓存策略：页面、共享文件与列表每次重新验证；内置图标可直接缓存
+CACHE_CONTROL_DEFAULT = 'no-cache'
+CACHE_CONTROL_IMAGE = 'public, max-age=3600'
+# zip打包时每次从磁盘读取并写入的块大小，决定单个下载的内存占用上限
+ZIP_CHUNK_SIZE = 1024 * 1024
+# 流式响应（分块zip）合并小块写出的缓冲大小
+STREAM_BUFFER_SIZE = 256 * 1024
+# zip压缩级别（1-9），0表示全部仅存储不压缩
+ZIP_COMPRESS_LEVEL = 6
+# 已压缩格式（图片、音视频、文档、压缩包）直接存储，重复压缩只浪费CPU
+ZIP_STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp3', '.aac', '.m4a', '.ogg', '.flac',
+    '.mp4', '.m4v', '.mov', '.avi', '.mkv', '.wmv', '.webm', '.pdf', '.docx', '.xlsx', '.pptx',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz', '.zst', '.jar', '.apk', '.iso',
+}
+# 文本类格式压缩收益高，直接压缩
+ZIP_DEFLATE_EXTENSIONS = {
+    '.txt', '.log', '.csv', '.json', '.xml', '.html', '.htm', '.css', '.js', '.md', '.py',
+    '.c', '.h', '.cpp', '.java', '.ini', '.cfg', '.yaml', '.yml', '.sql', '.svg', '.bmp',
+    '.doc', '.xls', '.ppt', '.tsv', '.tif', '.tiff', '.wav',
+}
+# 未知类型：取文件开头样本试压缩，压缩率不足该比例则按不可压缩数据存储
+ZIP_SAMPLE_SIZE = 64 * 1024
+ZIP_SAMPLE_MAX_RATIO = 0.9
+# 按字节计已压缩格式占比达到该值时整包改用存储模式：压缩收益很小，换取确定长度与断点续传
+ZIP_STORE_AUTO_RATIO = 0.9
+# 上传：单次请求体大小上限（字节）、请求体读取块大小、单次请求最多分段数
+UPLOAD_MAX_BYTES = 64 * 1024 ** 3
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_PARTS = 1000
+# 分块断点续传：建议分块大小、单个分块请求上限、会话空闲过期时间（秒）、临时文件后缀
+UPLOAD_SESSION_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_MAX_CHUNK = 64 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+UPLOAD_PART_SUFFIX = '.fsupload'
+# 响应压缩：小于该字节数的响应不压缩；可压缩的类型（text/* 之外）；动态/静态压缩级别
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+GZIP_LEVEL_DYNAMIC = 6
+GZIP_LEVEL_STATIC = 9
+BROTLI_QUALITY_DYNAMIC = 4
+BROTLI_QUALITY_STATIC = 11
+# 静态资源内存缓存：总字节预算（含压缩版本）与单个文件上限
+STATIC_CACHE_MAX_BYTES = 16 * 1024 * 1024
+STATIC_CACHE_MAX_FILE = 1024 * 1024
+# 访问日志（JSON-lines）：待写队列长度（满则丢弃）、单个文件大小上限、保留的历史文件数
+ACCESS_LOG_QUEUE_SIZE = 10000
+ACCESS_LOG_MAX_BYTES = 50 * 1024 * 1024
+ACCESS_LOG_BACKUPS = 5
+# /metrics 请求耗时直方图的桶上限（秒）
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# /metrics 的 method 标签只取这些值，其它方法统计为 other
+METRICS_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS')
+# /list 分页：默认与最大每页条数；目录条目快照有效期（秒）及缓存的目录数、排序结果数
+LIST_PAGE_DEFAULT = 200
+LIST_PAGE_MAX = 1000
+LIST_CACHE_TTL = 5
+LIST_CACHE_DIRS = 32
+LIST_CACHE_VIEWS = 16
+# 限速：令牌桶容量（按速率计的秒数），限速时单次收发的最大分片（字节）
+RATE_BURST_SECONDS = 0.25
+RATE_CHUNK_SIZE = 64 * 1024
+# 空闲超过该秒数的客户端限速状态被回收
+RATE_CLIENT_IDLE = 60
+# 参与限速的路由；列表、页面等小响应不限速，大传输进行时其他人的操作仍然流畅
+RATE_LIMITED_ROUTES = ('file', 'zip', 'upload')
+# 准入控制：同时进行的打包下载、上传数上限，每类的等待队列长度与最长等待秒数，
+# 拒绝时建议客户端重试的秒数；至少保留该比例的工作线程处理轻量请求
+ADMISSION_MAX_ZIP = 4
+ADMISSION_MAX_UPLOAD = 8
+ADMISSION_QUEUE = 8
+ADMISSION_WAIT = 10
+ADMISSION_RETRY_AFTER = 5
+ADMISSION_RESERVE_FRACTION = 0.25
+# 拒绝上传后关闭连接前最多读取并丢弃的请求体字节数与秒数，
+# 避免未读数据触发RST，使客户端收不到503
+ADMISSION_DRAIN_MAX = 64 * 1024 * 1024
+ADMISSION_DRAIN_SECONDS = 2
+# 请求路径解析缓存：条目数上限、单条有效期（秒）
+PATH_CACHE_SIZE = 4096
+PATH_CACHE_TTL = 5
+# 配置文件：变化检查间隔（秒）；GUI修改后延迟写盘（秒），期间的多次修改合并为一次写入
+CONFIG_WATCH_INTERVAL = 1.0
+CONFIG_SAVE_DELAY = 0.5
 
 def refresh_all(on_finish=None):
     """
     无中断刷新所有可刷新项（IP、端口、二维码等），只更新配置和相关类属性，不重启服务。
     刷新完成后可调用on_finish回调（如有）。
     """
+    config_service.reload()
     cfg = load_config()
+    # start_server 传入的覆盖项优先于配置文件
+    cfg.update(_config_overrides)
     FileServer.SHARE_DIR = cfg['dir']
     FileServer.PASSWORD = cfg['password']
     FileServer.ENABLE_LOGIN = (cfg['pw_enabled'] == '1')
+    _apply_tuning(cfg)
+    if FileServer.SHARE_DIR:
+        dir_size_index.start(FileServer.SHARE_DIR)
     # 重新载入配置时，需清空登录数据（按要求），但保留 webserver_log
     try:
-        if logged_in_ips:
-            log_message(f"重新载入配置: 清空已登录用户记录: {list(logged_in_ips.keys())}")
-        logged_in_ips.clear()
-        client_last_seen.clear()
+        with _state_lock:
+            if len(auth_sessions):
+                log_message(f"重新载入配置: 清空已登录用户记录: {auth_sessions.clients()}")
+            auth_sessions.clear()
+            client_last_seen.clear()
     except Exception as e:
         log_message(f"重新载入配置: 清空已登录用户记录异常: {e}")
     # 端口刷新仅在端口未变时有效，否则需重启服务
@@ -54,7 +359,7 @@ def refresh_all(on_finish=None):
             # 端口变化需重启服务，兼容原逻辑
             force_stop_server()
             time.sleep(0.5)
-            start_server()
+            start_server(_config_overrides)
             if on_finish:
                 on_finish()
     except Exception:
@@ -68,10 +373,10 @@ def log_message(msg):
 
 def get_log():
     """
-    获取当前日志内容（列表，每行为字符串）。
+    获取内存中保留的日志内容（列表，每行为字符串）。增量读取请用 webserver_log.read_since(seq)。
     :return: list[str]
     """
-    return list(webserver_log)
+    return webserver_log.snapshot()
 
 def get_config_dir():
     # 支持PyInstaller打包后路径
@@ -86,19 +391,1691 @@ def get_config_dir():
 def get_config_file():
     return os.path.join(get_config_dir(), 'config.txt')
 
+def get_log_dir():
+    # 与 share.py 的日志目录一致：config 目录的同级 log 目录
+    return os.path.join(os.path.dirname(get_config_dir()), 'log')
+
+# GUI管理的配置项，写回文件时排在最前
+CONFIG_GUI_KEYS = ('dir', 'port', 'pw_enabled', 'password')
+
+class ConfigService:
+    """
+    配置服务：config.txt 只解析一次，结果保存为只读快照，读取不访问磁盘。
+    - 后台线程按 CONFIG_WATCH_INTERVAL 检查文件 mtime/大小，变化时重新解析并整体替换快照；
+    - update() 立即更新快照，写盘延迟 CONFIG_SAVE_DELAY 秒合并（GUI逐字输入时只写一次），
+      由一个常驻写盘线程按截止时间执行，写入临时文件后 os.replace，读者不会看到写了一半的文件；
+    - 快照内容变化时依次调用订阅者 callback(old, new)。
+    """
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = dict(defaults)
+        self._lock = threading.RLock()
+        self._values = {}  # 文件中的配置项（不含默认值），保持文件中的顺序
+        self._snapshot = MappingProxyType(dict(self.defaults))
+        self._stat = None
+        self._dirty = False
+        self._flush_at = None  # 延迟写盘的截止时间（monotonic），None 表示无待写修改
+        self._flush_wake = threading.Event()
+        self._flusher = None
+        self._subscribers = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def get(self):
+        """当前配置的只读快照"""
+        return self._snapshot
+
+    def subscribe(self, callback):
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def reload(self, force=False):
+        """文件有变化（或force）时重新解析，返回是否重新读取"""
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        with self._lock:
+            if not force and stat == self._stat:
+                return False
+            values = {}
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if '=' in line:
+                            k, v = line.strip().split('=', 1)
+                            values[k] = v
+            except OSError:
+                pass
+            self._stat = stat
+            if self._dirty:
+                # 尚未写盘的修改优先
+                values.update({k: v for k, v in self._values.items() if values.get(k) != v})
+            self._values = values
+            changes = self._publish()
+        self._notify(changes)
+        return True
+
+    def update(self, values, delay=CONFIG_SAVE_DELAY):
+        """修改配置项：快照立即生效，delay 秒内的多次修改合并写盘一次"""
+        with self._lock:
+            for k, v in values.items():
+                self._values[k] = str(v)
+            self._dirty = True
+            changes = self._publish()
+            self._flush_at = time.monotonic() + delay
+            self._flush_wake.set()
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='config-flusher', daemon=True)
+                self._flusher.start()
+        self._notify(changes)
+
+    def _flush_loop(self):
+        # 常驻写盘线程：等到最近一次修改的截止时间再写盘，期间的新修改只推迟截止时间
+        while True:
+            with self._lock:
+                deadline = self._flush_at
+                self._flush_wake.clear()
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                self.flush()
+                continue
+            self._flush_wake.wait(timeout)
+
+    def flush(self):
+        """立即写入未保存的修改"""
+        with self._lock:
+            self._flush_at = None
+            if not self._dirty:
+                return
+            keys = [k for k in CONFIG_GUI_KEYS if k in self._values]
+            keys += [k for k in self._values if k not in CONFIG_GUI_KEYS]
+            text = ''.join(f'{k}={self._values[k]}\n' for k in keys)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, self.path)
+                st = os.stat(self.path)
+                self._stat = (st.st_mtime_ns, st.st_size)
+                self._dirty = False
+            except OSError as e:
+                log_message(f"保存配置失败: {e}")
+
+    def start(self):
+        """启动文件变化监视线程（重复调用无副作用）"""
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name='config-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(CONFIG_WATCH_INTERVAL):
+            try:
+                self.reload()
+            except Exception as e:
+                log_message(f"配置重新读取异常: {e}")
+
+    def _publish(self):
+        # 生成新快照并返回 (旧, 新)，内容未变时返回None；调用方持有锁
+        merged = dict(self.defaults)
+        merged.update(self._values)
+        old = self._snapshot
+        if merged == dict(old):
+            return None
+        self._snapshot = MappingProxyType(merged)
+        return old, self._snapshot
+
+    def _notify(self, changes):
+        if changes is None:
+            return
+        for callback in list(self._subscribers):
+            try:
+                callback(*changes)
+            except Exception as e:
+                log_message(f"配置变更通知异常: {e}")
+
+# 全局配置服务，webserver 与 guiserver 共用
+config_service = ConfigService(get_config_file(), {
+    'dir': '', 'port': '8000', 'pw_enabled': '1', 'password': '123456',
+    'engine': SERVER_ENGINE, 'workers': str(MAX_WORKERS), 'queue': str(REQUEST_QUEUE_SIZE)})
+
 def load_config():
-    config_path = get_config_file()
-    result = {'dir':'', 'port':'8000', 'pw_enabled':'1', 'password':'123456'}
+    """当前配置（快照的可修改副本，不读磁盘）"""
+    return dict(config_service.get())
+
+def _cfg_int(cfg, key, default, minimum=1):
+    # 读取整数配置项，非法值（或小于 minimum）回退默认值
+    value = str(cfg.get(key, '')).strip()
+    return int(value) if value.isdigit() and int(value) >= minimum else default
+
+def _apply_tuning(cfg):
+    # 应用可在线调整的性能参数（启动与无中断刷新时调用）
+    keep_alive = cfg.get('keepalive', '1' if HTTP_KEEP_ALIVE else '0') == '1'
+    FileServer.protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+    FileServer.KEEPALIVE_TIMEOUT = _cfg_int(cfg, 'keepalive_timeout', KEEPALIVE_TIMEOUT)
+    FileServer.KEEPALIVE_MAX_REQUESTS = _cfg_int(cfg, 'keepalive_max', KEEPALIVE_MAX_REQUESTS)
+    level = str(cfg.get('zip_level', '')).strip()
+    FileServer.ZIP_COMPRESS_LEVEL = min(int(level), 9) if level.isdigit() else ZIP_COMPRESS_LEVEL
+    FileServer.UPLOAD_MAX_BYTES = _cfg_int(cfg, 'upload_max_mb', UPLOAD_MAX_BYTES // 1024 // 1024) * 1024 * 1024
+    webserver_log.set_capacity(_cfg_int(cfg, 'log_capacity', LOG_RING_CAPACITY))
+    access = str(cfg.get('access_log', '0')).strip()
+    if access in ('', '0'):
+        access_log.configure(None)
+    else:
+        access_log.configure(os.path.join(get_log_dir(), 'access.jsonl') if access == '1' else access)
+    bandwidth.configure(_cfg_int(cfg, 'rate_limit', 0) * 1024, _cfg_int(cfg, 'rate_limit_client', 0) * 1024,
+                        {route: _cfg_int(cfg, f'rate_limit_{route}', 0) * 1024 for route in RATE_LIMITED_ROUTES})
+    admission.configure({'zip': _cfg_int(cfg, 'max_zip', ADMISSION_MAX_ZIP),
+                         'upload': _cfg_int(cfg, 'max_upload', ADMISSION_MAX_UPLOAD)},
+                        _cfg_int(cfg, 'admission_queue', ADMISSION_QUEUE, minimum=0))
+    static_asset_cache.set_budget(_cfg_int(cfg, 'static_cache_mb', STATIC_CACHE_MAX_BYTES // 1024 // 1024) * 1024 * 1024)
+
+class ChunkedWriter:
+    """
+    流式响应（如zip）的输出包装，供长度未知的响应使用：
+    chunked 为 True 时按 Transfer-Encoding: chunked 分块，否则原样写出（以关闭连接结束）。
+    zipfile 逐成员写入的小块先合并到 STREAM_BUFFER_SIZE 再写出，减少系统调用与分块开销。
+    不提供 tell/seek，zipfile 会按不可定位流处理。
+    """
+    def __init__(self, wfile, chunked=True):
+        self._wfile = wfile
+        self._chunked = chunked
+        self._buf = bytearray()
+
+    def write(self, data):
+        if not data:
+            return 0
+        size = len(data)
+        if not self._buf and size >= STREAM_BUFFER_SIZE:
+            self._emit(data)
+        else:
+            self._buf += data
+            if len(self._buf) >= STREAM_BUFFER_SIZE:
+                self.flush()
+        return size
+
+    def flush(self):
+        if self._buf:
+            self._emit(self._buf)
+            self._buf = bytearray()
+
+    def _emit(self, data):
+        if self._chunked:
+            self._wfile.write(b'%x\r\n' % len(data))
+            self._wfile.write(data)
+            self._wfile.write(b'\r\n')
+        else:
+            self._wfile.write(data)
+
+    def close(self):
+        self.flush()
+        if self._chunked:
+            # 写出结束块
+            self._wfile.write(b'0\r\n\r\n')
+
+def zip_compress_type(abs_file, level=ZIP_COMPRESS_LEVEL):
+    """
+    按文件类型决定zip成员的压缩方式：已压缩格式存储，文本类压缩，
+    其它类型抽样试压缩判断是否值得压缩。
+    """
+    if level <= 0:
+        return zipfile.ZIP_STORED
+    ext = os.path.splitext(abs_file)[1].lower()
+    if ext in ZIP_STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    if ext in ZIP_DEFLATE_EXTENSIONS:
+        return zipfile.ZIP_DEFLATED
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if '=' in line:
-                    k, v = line.strip().split('=', 1)
-                    result[k] = v
-    except Exception:
-        pass
-    #print(result)
-    return result
+        with open(abs_file, 'rb') as f:
+            sample = f.read(ZIP_SAMPLE_SIZE)
+    except OSError:
+        return zipfile.ZIP_DEFLATED
+    if len(sample) < 1024:
+        return zipfile.ZIP_DEFLATED
+    if len(zlib.compress(sample, 1)) > len(sample) * ZIP_SAMPLE_MAX_RATIO:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+# 仅存储模式zip的CRC缓存：(路径, 大小, mtime_ns) -> crc32，续传时免去重新读文件
+ZIP_CRC_CACHE_SIZE = 100000
+_zip_crc_cache = OrderedDict()
+_zip_crc_lock = threading.Lock()
+
+class StoredZipPlan:
+    """
+    仅存储（不压缩）模式的zip归档布局。
+    本地文件头、数据、数据描述符、中央目录及ZIP64记录的长度只取决于文件名和文件大小，
+    因此发送前即可算出精确的 Content-Length，并能从任意偏移开始输出（支持Range续传）。
+    CRC写在数据描述符与中央目录中：顺序下载时边发送边计算，续传时取自缓存或重新读取文件。
+    """
+    FLAGS = 0x0808  # bit3: 使用数据描述符；bit11: 文件名为UTF-8
+
+    def __init__(self, entries):
+        # entries: [(arcname, abs_path, size, mtime_ns), ...]
+        self.entries = entries
+        self.crcs = [None] * len(entries)
+        self.segments = []  # (起始偏移, 长度, 类型, 参数)
+        self._central = None
+        offset = 0
+        local_offsets = []
+        for i, (arcname, abs_path, size, mtime_ns) in enumerate(entries):
+            local_offsets.append(offset)
+            header = self._local_header(i)
+            offset = self._add(offset, len(header), 'bytes', header)
+            offset = self._add(offset, size, 'file', i)
+            offset = self._add(offset, 24 if self._zip64(size) else 16, 'descriptor', i)
+        self.local_offsets = local_offsets
+        self.central_offset = offset
+        self.central_size = sum(len(self._central_entry(i)) for i in range(len(entries)))
+        offset = self._add(offset, self.central_size, 'central', None)
+        end = self._end_records()
+        offset = self._add(offset, len(end), 'bytes', end)
+        self.size = offset
+        self.starts = [seg[0] for seg in self.segments]
+        digest = hashlib.sha1()
+        for arcname, abs_path, size, mtime_ns in entries:
+            digest.update(f'{arcname}\0{size}\0{mtime_ns}\n'.encode('utf-8'))
+        self.etag = f'"zip-{digest.hexdigest()[:24]}"'
+        self.mtime = max((e[3] for e in entries), default=0) // 1_000_000_000
+
+    def _add(self, offset, length, kind, arg):
+        if length > 0:
+            self.segments.append((offset, length, kind, arg))
+        return offset + length
+
+    @staticmethod
+    def _zip64(size):
+        return size >= 0xFFFFFFFF
+
+    def _name(self, i):
+        return self.entries[i][0].replace(os.sep, '/').encode('utf-8')
+
+    def _dos_time(self, i):
+        t = time.localtime(self.entries[i][3] / 1_000_000_000)
+        if t.tm_year < 1980:
+            return 0, (0 << 9) | (1 << 5) | 1
+        dostime = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        dosdate = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        return dostime, dosdate
+
+    def _local_header(self, i):
+        name = self._name(i)
+        size = self.entries[i][2]
+        dostime, dosdate = self._dos_time(i)
+        if self._zip64(size):
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            version, sizes = 45, 0xFFFFFFFF
+        else:
+            extra = b''
+            version, sizes = 20, 0
+        return struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', version, 0, self.FLAGS, zipfile.ZIP_STORED,
+                           dostime, dosdate, 0, sizes, sizes, len(name), len(extra)) + name + extra
+
+    def _descriptor(self, i):
+        size = self.entries[i][2]
+        if self._zip64(size):
+            return struct.pack('<4sLQQ', b'PK\x07\x08', self.crc(i), size, size)
+        return struct.pack('<4sLLL', b'PK\x07\x08', self.crc(i), size, size)
+
+    def _central_entry(self, i, crc=0):
+        name = self._name(i)
+        size = self.entries[i][2]
+        offset = self.local_offsets[i]
+        dostime, dosdate = self._dos_time(i)
+        fields = []
+        if self._zip64(size):
+            fields += [size, size]
+            size32 = 0xFFFFFFFF
+        else:
+            size32 = size
+        if offset >= 0xFFFFFFFF:
+            fields.append(offset)
+            offset32 = 0xFFFFFFFF
+        else:
+            offset32 = offset
+        extra = struct.pack('<HH' + 'Q' * len(fields), 1, 8 * len(fields), *fields) if fields else b''
+        version = 45 if fields else 20
+        return struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', version, 0, version, 0, self.FLAGS,
+                           zipfile.ZIP_STORED, dostime, dosdate, crc, size32, size32,
+                           len(name), len(extra), 0, 0, 0, 0, offset32) + name + extra
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if count >= 0xFFFF or self.central_offset >= 0xFFFFFFFF or self.central_size >= 0xFFFFFFFF:
+            zip64_end_offset = self.central_offset + self.central_size
+            records += struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                                   count, count, self.central_size, self.central_offset)
+            records += struct.pack('<4sLQL', b'PK\x06\x07', 0, zip64_end_offset, 1)
+        records += struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                               min(self.central_size, 0xFFFFFFFF), min(self.central_offset, 0xFFFFFFFF), 0)
+        return records
+
+    def crc(self, i):
+        """取第i个成员的CRC32：本次已计算 > 缓存 > 重新读取文件"""
+        if self.crcs[i] is not None:
+            return self.crcs[i]
+        arcname, abs_path, size, mtime_ns = self.entries[i]
+        key = (abs_path, size, mtime_ns)
+        with _zip_crc_lock:
+            crc = _zip_crc_cache.get(key)
+            if crc is not None:
+                _zip_crc_cache.move_to_end(key)
+        if crc is None:
+            crc = 0
+            with open(abs_path, 'rb') as f:
+                while True:
+                    chunk = f.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+            self.remember_crc(i, crc)
+        self.crcs[i] = crc
+        return crc
+
+    def remember_crc(self, i, crc):
+        arcname, abs_path, size, mtime_ns = self.entries[i]
+        self.crcs[i] = crc
+        with _zip_crc_lock:
+            _zip_crc_cache[(abs_path, size, mtime_ns)] = crc
+            while len(_zip_crc_cache) > ZIP_CRC_CACHE_SIZE:
+                _zip_crc_cache.popitem(last=False)
+
+    def central_directory(self):
+        if self._central is None:
+            self._central = b''.join(self._central_entry(i, self.crc(i)) for i in range(len(self.entries)))
+        return self._central
+
+def parse_header_params(value):
+    """
+    解析形如 'form-data; name="file"; filename="a.txt"' 的头部值，
+    返回 (主值, 参数字典)。替代已弃用的 cgi.parse_header。
+    """
+    parts = []
+    current = ''
+    quoted = False
+    for ch in value or '':
+        if ch == '"':
+            quoted = not quoted
+        if ch == ';' and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += ch
+    parts.append(current)
+    main = parts[0].strip().lower()
+    params = {}
+    for item in parts[1:]:
+        if '=' not in item:
+            continue
+        k, v = item.split('=', 1)
+        k, v = k.strip().lower(), v.strip()
+        if len(v) >= 2 and v[0] == v[-1] == '"':
+            v = v[1:-1].replace('\\"', '"')
+        if k.endswith('*') and "''" in v:
+            # RFC 5987: charset''percent-encoded
+            charset, encoded = v.split("''", 1)
+            k, v = k[:-1], unquote(encoded, encoding=charset or 'utf-8', errors='replace')
+        params[k] = v
+    return main, params
+
+class MultipartError(ValueError):
+    """multipart 请求体格式错误"""
+
+class MultipartPart:
+    """multipart 中的一个分段，数据需在读取下一个分段前通过 stream_to / read / discard 消费"""
+    def __init__(self, reader, headers):
+        self.headers = headers
+        disposition, params = parse_header_params(headers.get('content-disposition', ''))
+        self.name = params.get('name')
+        self.filename = params.get('filename')
+        self._reader = reader
+        self.done = False
+
+    def stream_to(self, write):
+        """分块把分段数据交给write回调，返回字节数"""
+        size = self._reader._read_data(write)
+        self.done = True
+        return size
+
+    def read(self, limit=64 * 1024):
+        # 读取普通表单字段（限制大小）
+        chunks = []
+        def collect(data):
+            if sum(map(len, chunks)) + len(data) > limit:
+                raise MultipartError('表单字段过大')
+            chunks.append(bytes(data))
+        self.stream_to(collect)
+        return b''.join(chunks)
+
+    def discard(self):
+        self.stream_to(lambda data: None)
+
+class MultipartReader:
+    """
+    流式 multipart/form-data 解析器：按 UPLOAD_CHUNK_SIZE 从请求体读取，
+    逐个产出分段，分段数据直接写往目标位置，不落临时文件，也不整体读入内存。
+    迭代结束时请求体已被完整读尽，连接可继续复用。
+    """
+    MAX_HEADER_SIZE = 16 * 1024
+
+    def __init__(self, rfile, boundary, length, bufsize=None, max_parts=None):
+        self._rfile = rfile
+        self._remaining = length
+        self._bufsize = bufsize or UPLOAD_CHUNK_SIZE
+        self._max_parts = max_parts or UPLOAD_MAX_PARTS
+        self._delim = b'\r\n--' + boundary
+        # 预置CRLF，使第一个分隔符与后续分隔符的匹配方式一致
+        self._buf = bytearray(b'\r\n')
+
+    def _fill(self):
+        if self._remaining <= 0:
+            return False
+        data = self._rfile.read(min(self._bufsize, self._remaining))
+        if not data:
+            raise MultipartError('请求体不完整')
+        self._remaining -= len(data)
+        self._buf += data
+        return True
+
+    def _need(self, n):
+        while len(self._buf) < n:
+            if not self._fill():
+                raise MultipartError('请求体不完整')
+
+    def _read_data(self, write):
+        # 读到下一个分隔符为止；缓冲区末尾保留可能是半个分隔符的部分
+        delim = self._delim
+        keep = len(delim) - 1
+        size = 0
+        while True:
+            idx = self._buf.find(delim)
+            if idx >= 0:
+                if idx:
+                    write(bytes(self._buf[:idx]))
+                    size += idx
+                del self._buf[:idx + len(delim)]
+                return size
+            if len(self._buf) > keep:
+                n = len(self._buf) - keep
+                write(bytes(self._buf[:n]))
+                size += n
+                del self._buf[:n]
+            if not self._fill():
+                raise MultipartError('分段未正常结束')
+
+    def _read_headers(self):
+        self._need(2)
+        if self._buf[:2] == b'\r\n':
+            del self._buf[:2]
+            return {}
+        while True:
+            idx = self._buf.find(b'\r\n\r\n')
+            if idx >= 0:
+                break
+            if len(self._buf) > self.MAX_HEADER_SIZE or not self._fill():
+                raise MultipartError('分段头部无效')
+        raw = bytes(self._buf[:idx]).decode('utf-8', errors='replace')
+        del self._buf[:idx + 4]
+        headers = {}
+        for line in raw.split('\r\n'):
+            if ':' in line:
+                k, v = line.split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+        return headers
+
+    def drain(self):
+        # 丢弃结束分隔符之后的剩余内容，保证请求体被读尽
+        self._buf.clear()
+        while self._remaining > 0:
+            data = self._rfile.read(min(self._bufsize, self._remaining))
+            if not data:
+                break
+            self._remaining -= len(data)
+
+    def __iter__(self):
+        # 跳过前导内容直到第一个分隔符
+        self._read_data(lambda data: None)
+        count = 0
+        while True:
+            self._need(2)
+            if self._buf[:2] == b'--':
+                self.drain()
+                return
+            # 分隔符行可能带有空白填充
+            while self._buf[:1] in (b' ', b'\t'):
+                del self._buf[:1]
+                self._need(2)
+            if self._buf[:2] != b'\r\n':
+                raise MultipartError('分隔符格式错误')
+            del self._buf[:2]
+            count += 1
+            if count > self._max_parts:
+                raise MultipartError('分段数量超出限制')
+            part = MultipartPart(self, self._read_headers())
+            yield part
+            if not part.done:
+                part.discard()
+
+def is_compressible(content_type):
+    ctype = content_type.split(';', 1)[0].strip().lower()
+    return ctype.startswith('text/') or ctype in COMPRESSIBLE_TYPES
+
+def choose_encoding(accept_encoding):
+    """
+    按 Accept-Encoding 协商压缩算法：支持 br（安装了brotli时）与 gzip，
+    同等权重优先 br；q=0 表示拒绝。不需要压缩时返回 None。
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress_bytes(data, encoding, static=False):
+    # 静态资源只压缩一次，使用最高压缩级别；动态响应使用较快的级别
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY_STATIC if static else BROTLI_QUALITY_DYNAMIC)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL_STATIC if static else GZIP_LEVEL_DYNAMIC, mtime=0)
+
+class _StaticAsset:
+    # 缓存的静态资源：校验用的mtime与大小、原始内容、按编码缓存的压缩版本
+    __slots__ = ('mtime_ns', 'size', 'data', 'encoded')
+
+    def __init__(self, st, data):
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.data = data
+        self.encoded = {}
+
+    def weight(self):
+        return len(self.data) + sum(len(v) for v in self.encoded.values())
+
+class StaticAssetCache:
+    """
+    页面、图标等内置静态资源的内存缓存，热点请求不再打开磁盘文件。
+    - 只缓存不超过 STATIC_CACHE_MAX_FILE 的小文件，LRU淘汰，总字节数（含压缩版本）不超过预算；
+    - 每次访问按文件mtime与大小校验，变化则重新读取并丢弃旧的压缩版本；
+    - 服务启动时预加载。
+    """
+    def __init__(self, max_bytes=STATIC_CACHE_MAX_BYTES):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._bytes = 0
+        self.max_bytes = max_bytes
+
+    def get(self, abs_path):
+        """返回 (资源, stat结果)；文件过大不缓存时资源为None，文件不存在抛出OSError"""
+        st = os.stat(abs_path)
+        if st.st_size > min(STATIC_CACHE_MAX_FILE, self.max_bytes):
+            return None, st
+        with self._lock:
+            asset = self._items.get(abs_path)
+            if asset is not None and asset.mtime_ns == st.st_mtime_ns and asset.size == st.st_size:
+                self._items.move_to_end(abs_path)
+                return asset, st
+        with open(abs_path, 'rb') as f:
+            data = f.read()
+        if len(data) != st.st_size:
+            # 读取期间文件被改写，本次不缓存
+            return None, st
+        asset = _StaticAsset(st, data)
+        with self._lock:
+            self._discard(abs_path)
+            self._items[abs_path] = asset
+            self._bytes += asset.weight()
+            self._evict()
+        return asset, st
+
+    def encoded(self, abs_path, asset, encoding):
+        """取资源的压缩版本，首次使用时以最高级别压缩并缓存"""
+        with self._lock:
+            data = asset.encoded.get(encoding)
+        if data is not None:
+            return data
+        data = compress_bytes(asset.data, encoding, static=True)
+        with self._lock:
+            if self._items.get(abs_path) is asset and encoding not in asset.encoded:
+                asset.encoded[encoding] = data
+                self._bytes += len(data)
+                self._evict()
+        return data
+
+    def preload(self, paths):
+        for abs_path in paths:
+            try:
+                asset, st = self.get(abs_path)
+            except OSError:
+                continue
+            if asset is None or st.st_size < COMPRESS_MIN_SIZE:
+                continue
+            ctype = mimetypes.guess_type(abs_path)[0] or ''
+            if is_compressible(ctype):
+                for encoding in ('br', 'gzip'):
+                    if encoding != 'br' or brotli is not None:
+                        self.encoded(abs_path, asset, encoding)
+
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _discard(self, abs_path):
+        asset = self._items.pop(abs_path, None)
+        if asset is not None:
+            self._bytes -= asset.weight()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._items:
+            abs_path, asset = self._items.popitem(last=False)
+            self._bytes -= asset.weight()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+# 全局静态资源缓存
+static_asset_cache = StaticAssetCache()
+
+def make_etag(st):
+    """
+    由 (inode, 大小, 修改时间) 生成ETag。
+    文件在最近一秒内被修改时，同一时间戳内仍可能变化，此时返回弱ETag。
+    """
+    tag = f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+    if time.time() - st.st_mtime < 1:
+        return 'W/' + tag
+    return tag
+
+def parse_range_header(header, size):
+    """
+    解析 Range 请求头（RFC 7233，仅支持 bytes 单位）。
+    :return: None 表示忽略Range（格式错误或段数过多），[] 表示范围无法满足（应返回416），
+             否则为按起点排序并合并重叠后的 [(start, end), ...]，end 为闭区间
+    """
+    if not header or not header.strip().lower().startswith('bytes='):
+        return None
+    specs = header.strip()[6:].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, last = spec.split('-', 1)
+        first, last = first.strip(), last.strip()
+        if first == '':
+            # 后缀形式：bytes=-500 表示最后500字节
+            if not last.isdigit():
+                return None
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class _DirNode:
+    # 单个目录的索引信息：自身mtime、直属文件大小之和、子目录列表
+    __slots__ = ('mtime_ns', 'files', 'subdirs')
+
+    def __init__(self, mtime_ns, files, subdirs):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+
+class DirSizeIndex:
+    """
+    目录大小索引，替代每次 /list 时对子目录的完整 os.walk。
+    - 启动时在后台线程中用一次 scandir 遍历扫描整个共享目录，每个目录只列出一次；
+    - 每个目录只记录直属文件大小，查询时汇总子树；
+    - 查询时对子树中每个目录 stat 一次验证mtime（不列目录），变化的只重扫该目录，
+      服务外在深层目录中的增删也能反映到上层目录的大小；
+    - 经由服务器的上传、删除、新建操作调用 invalidate 主动失效；
+    - 原地改写文件不改变目录mtime，大小在该目录下次变化后才更新。
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._nodes = {}
+        self._root = None
+        self._generation = 0
+
+    def start(self, root):
+        """以root为共享根目录启动（或切换）索引，后台构建"""
+        root = os.path.abspath(root)
+        with self._lock:
+            if root == self._root:
+                return
+            self._root = root
+            self._nodes = {}
+            self._generation += 1
+            generation = self._generation
+        threading.Thread(target=self._run, args=(root, generation), name='dir-size-index', daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            self._root = None
+            self._nodes = {}
+            self._generation += 1
+
+    def _run(self, root, generation):
+        started = time.perf_counter()
+        self._build(root, generation)
+        if generation != self._generation:
+            return
+        log_message(f"目录大小索引构建完成: {len(self._nodes)} 个目录，用时 {time.perf_counter() - started:.2f}s")
+
+    def _build(self, root, generation):
+        # 按 _scan 给出的子目录逐层扫描整个目录树（每个目录只列出一次），完成后一次性替换
+        nodes = {}
+        pending = [root]
+        while pending:
+            if generation != self._generation:
+                return
+            path = pending.pop()
+            node = self._scan(path, root)
+            if node is not None:
+                nodes[path] = node
+                pending.extend(node.subdirs)
+        with self._lock:
+            if generation == self._generation:
+                self._nodes = nodes
+
+    @staticmethod
+    def _scan(path, root):
+        # 只扫描一层：与原 os.walk 统计口径一致，不进入符号链接目录，不统计指向共享目录之外的链接文件
+        files = 0
+        subdirs = []
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_symlink() and not (root and path_resolver.contains(root, entry.path)):
+                            continue
+                        elif entry.is_file():
+                            files += entry.stat().st_size
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        return _DirNode(mtime_ns, files, subdirs)
+
+    def _fresh_node(self, path):
+        # 取目录节点，mtime变化或不存在时重扫该目录
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            node = self._nodes.get(path)
+            if node is not None and node.mtime_ns == mtime_ns:
+                return node
+        node = self._scan(path, self._root)
+        if node is None:
+            return None
+        with self._lock:
+            old = self._nodes.get(path)
+            if old is not None:
+                for gone in set(old.subdirs) - set(node.subdirs):
+                    self._drop_subtree(gone)
+            self._nodes[path] = node
+        return node
+
+    def get_size(self, path):
+        """返回目录递归总大小（字节）"""
+        # 逐个验证子树中的目录：未变化的只需一次 stat，变化的重扫该目录
+        total = 0
+        pending = [os.path.abspath(path)]
+        while pending:
+            node = self._fresh_node(pending.pop())
+            if node is not None:
+                total += node.files
+                pending.extend(node.subdirs)
+        return total
+
+    def invalidate(self, path):
+        """目录内容发生变化（上传/删除/新建）时调用，下次访问时重扫该目录"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if not os.path.isdir(path):
+                self._drop_subtree(path)
+            node = self._nodes.get(path)
+            if node is not None:
+                node.mtime_ns = None
+
+    def _drop_subtree(self, path):
+        prefix = path + os.sep
+        for key in [k for k in self._nodes if k == path or k.startswith(prefix)]:
+            del self._nodes[key]
+
+# 全局目录大小索引
+dir_size_index = DirSizeIndex()
+
+class UploadSession:
+    # 一次分块上传：目标路径、总大小、临时文件、已收到的区间（左闭右开，已合并排序）
+    __slots__ = ('id', 'key', 'path', 'part_path', 'size', 'received', 'last_active', 'lock')
+
+    def __init__(self, sid, key, path, part_path, size):
+        self.id = sid
+        self.key = key
+        self.path = path
+        self.part_path = part_path
+        self.size = size
+        self.received = []
+        self.last_active = time.time()
+        self.lock = threading.Lock()
+
+    def add_range(self, start, end):
+        ranges = self.received + [[start, end]]
+        ranges.sort()
+        merged = []
+        for s, e in ranges:
+            if merged and s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        self.received = merged
+
+    def received_bytes(self):
+        return sum(e - s for s, e in self.received)
+
+    def complete(self):
+        return self.size == 0 or self.received == [[0, self.size]]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': os.path.basename(self.path),
+            'size': self.size,
+            'chunkSize': UPLOAD_SESSION_CHUNK_SIZE,
+            'received': [list(r) for r in self.received],
+        }
+
+class UploadSessionStore:
+    """
+    分块断点续传会话表。
+    - 数据先写入目标目录下的隐藏临时文件，全部分块到齐后原子改名为目标文件；
+    - 同一目标路径、大小与客户端指纹再次创建会话时返回原会话，客户端据此只补传缺失分块；
+    - 长时间无活动的会话连同临时文件一并清理。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._by_key = {}
+
+    def create(self, path, size, fingerprint=''):
+        key = (path, size, fingerprint)
+        self.expire()
+        with self._lock:
+            sid = self._by_key.get(key)
+            session = self._sessions.get(sid)
+            if session is not None:
+                session.last_active = time.time()
+                return session
+            sid = uuid.uuid4().hex
+            part_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{sid[:12]}{UPLOAD_PART_SUFFIX}")
+            session = UploadSession(sid, key, path, part_path, size)
+            # 预分配临时文件，各分块可按偏移并发写入
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            self._sessions[sid] = session
+            self._by_key[key] = sid
+            return session
+
+    def get(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+        if session is not None:
+            session.last_active = time.time()
+        return session
+
+    def remove(self, sid, delete_part=True):
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session is not None and self._by_key.get(session.key) == sid:
+                del self._by_key[session.key]
+        if session is not None and delete_part:
+            try:
+                os.remove(session.part_path)
+            except OSError:
+                pass
+        return session
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def expire(self):
+        deadline = time.time() - UPLOAD_SESSION_TTL
+        with self._lock:
+            stale = [sid for sid, s in self._sessions.items() if s.last_active < deadline]
+        for sid in stale:
+            self.remove(sid)
+
+    def clear(self):
+        with self._lock:
+            sids = list(self._sessions)
+        for sid in sids:
+            self.remove(sid)
+
+# 全局分块上传会话表
+upload_sessions = UploadSessionStore()
+
+def is_upload_part(name):
+    # 分块上传未完成的临时文件，不出现在列表与打包中
+    return name.startswith('.') and name.endswith(UPLOAD_PART_SUFFIX)
+
+class _CountingWriter:
+    # 包装 wfile：统计写出字节数，记录首字节写出时间（访问日志的 bytes_out / TTFB）；
+    # 设置 limiter 后按分片限速写出
+    def __init__(self, raw):
+        self._raw = raw
+        self.bytes = 0
+        self.first_write = None
+        self.limiter = None
+
+    def write(self, data):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        limiter = self.limiter
+        if limiter is not None and limiter.active and len(data) > RATE_CHUNK_SIZE:
+            view = memoryview(data)
+            for i in range(0, len(view), RATE_CHUNK_SIZE):
+                piece = view[i:i + RATE_CHUNK_SIZE]
+                limiter.throttle(len(piece))
+                self._raw.write(piece)
+                self.bytes += len(piece)
+            return len(data)
+        if limiter is not None:
+            limiter.throttle(len(data))
+        n = self._raw.write(data)
+        self.bytes += len(data)
+        return n
+
+    def count(self, n):
+        # 绕过 wfile 直接发送的字节（sendfile）
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+        self.bytes += n
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+class _CountingReader:
+    # 包装 rfile：统计读入字节数（访问日志的 bytes_in）；设置 limiter 后按分片限速读入
+    def __init__(self, raw):
+        self._raw = raw
+        self.bytes = 0
+        self.limiter = None
+
+    def read(self, size=-1):
+        limiter = self.limiter
+        if limiter is not None and limiter.active and size is not None and size > RATE_CHUNK_SIZE:
+            pieces = []
+            while size > 0:
+                piece = self._raw.read(min(size, RATE_CHUNK_SIZE))
+                if not piece:
+                    break
+                self._account(piece)
+                pieces.append(piece)
+                size -= len(piece)
+            return b''.join(pieces)
+        data = self._raw.read(size)
+        self._account(data)
+        return data
+
+    def read1(self, size=-1):
+        if self.limiter is not None and self.limiter.active and (size < 0 or size > RATE_CHUNK_SIZE):
+            size = RATE_CHUNK_SIZE
+        data = self._raw.read1(size)
+        self._account(data)
+        return data
+
+    def readline(self, *args):
+        data = self._raw.readline(*args)
+        self._account(data)
+        return data
+
+    def readinto(self, b):
+        if self.limiter is not None and self.limiter.active and len(b) > RATE_CHUNK_SIZE:
+            b = memoryview(b)[:RATE_CHUNK_SIZE]
+        n = self._raw.readinto(b)
+        self.bytes += n or 0
+        if self.limiter is not None:
+            self.limiter.throttle(n or 0)
+        return n
+
+    def _account(self, data):
+        self.bytes += len(data)
+        if self.limiter is not None:
+            self.limiter.throttle(len(data))
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+class AccessLogSink:
+    """
+    JSON-lines 访问日志，每个请求一行。
+    - 请求线程只把记录放入有界队列，队列满时丢弃并计数，从不阻塞请求；
+    - 单个后台线程序列化并批量写入，文件保持打开，超过大小上限时切分并保留若干历史文件。
+    """
+    def __init__(self):
+        self._queue = queue.Queue(ACCESS_LOG_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._path = None
+        self._thread = None
+        self.enabled = False
+        self.dropped = 0
+
+    def configure(self, path):
+        """path 为 None 时关闭访问日志"""
+        with self._lock:
+            self._path = path
+            self.enabled = bool(path)
+            if self.enabled and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+                self._thread.start()
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        f = None
+        opened = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            path = self._path
+            try:
+                if f is not None and (opened != path or f.tell() >= ACCESS_LOG_MAX_BYTES):
+                    f.close()
+                    f = None
+                    if opened == path:
+                        self._rotate(path)
+                if not path:
+                    continue
+                if f is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                    f = open(path, 'a', encoding='utf-8')
+                    opened = path
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in batch))
+                f.flush()
+            except OSError as e:
+                log_message(f"访问日志写入失败: {e}")
+                if f is not None:
+                    # 关闭失败的句柄，下一批重新打开；close 刷新缓冲失败时文件描述符仍会释放
+                    try:
+                        f.close()
+                    except OSError:
+                        pass
+                    finally:
+                        f = None
+
+    @staticmethod
+    def _rotate(path):
+        # access.jsonl -> access.jsonl.1 -> ... -> access.jsonl.N（最旧的删除）
+        for i in range(ACCESS_LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        os.replace(path, f"{path}.1")
+
+# 全局访问日志
+access_log = AccessLogSink()
+
+class TokenBucket:
+    """
+    令牌桶限速，rate 为每秒字节数（0 不限速）。
+    reserve() 先扣令牌再返回需等待的秒数，令牌可透支：多个传输同时排队时按预约先后依次放行，
+    每次只预约一个分片，因此各传输轮流前进、平分带宽。
+    """
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self.burst = 0
+        self._tokens = 0
+        self._stamp = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            if rate != self.rate:
+                self.burst = max(rate * RATE_BURST_SECONDS, RATE_CHUNK_SIZE) if rate else 0
+                self._tokens = self.burst if not self.rate else min(self._tokens, self.burst)
+                self._stamp = time.monotonic()
+                self.rate = rate
+
+    def reserve(self, n):
+        """预约n字节，返回需等待的秒数"""
+        with self._lock:
+            if not self.rate:
+                return 0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate) - n
+            self._stamp = now
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+class _TransferLimiter:
+    # 单个请求的限速器：依次向全局、路由、客户端令牌桶预约，等待其中最长的时间
+    __slots__ = ('shaper', 'buckets', 'ip')
+
+    def __init__(self, shaper, buckets, ip):
+        self.shaper = shaper
+        self.buckets = buckets
+        self.ip = ip
+
+    @property
+    def active(self):
+        return self.shaper.enabled
+
+    def throttle(self, n):
+        if not self.shaper.enabled or n <= 0:
+            return
+        wait = max(bucket.reserve(n) for bucket in self.buckets)
+        if wait > 0:
+            time.sleep(wait)
+
+class BandwidthShaper:
+    """
+    带宽整形：全局、每个客户端IP、每类路由（file/zip/upload）各一组令牌桶，一次收发需同时满足。
+    客户端状态（令牌桶、进行中的传输数）按IP保存，空闲超过 RATE_CLIENT_IDLE 秒后回收。
+    限速值由 configure() 在线修改，进行中的传输下一个分片即按新速率执行。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.global_bucket = TokenBucket()
+        self.route_buckets = {route: TokenBucket() for route in RATE_LIMITED_ROUTES}
+        self.client_rate = 0
+        self._clients = {}  # ip -> [令牌桶, 进行中的传输数, 最后使用时间]
+        self._last_prune = time.monotonic()
+
+    def configure(self, global_rate, client_rate, route_rates):
+        """速率单位为字节/秒，0 表示不限速"""
+        self.global_bucket.set_rate(global_rate)
+        for route, bucket in self.route_buckets.items():
+            bucket.set_rate(route_rates.get(route, 0))
+        with self._lock:
+            self.client_rate = client_rate
+            for state in self._clients.values():
+                state[0].set_rate(client_rate)
+        self.enabled = bool(global_rate or client_rate or any(route_rates.values()))
+
+    def acquire(self, ip, route):
+        """开始一次传输，返回限速器；结束时调用 release(limiter)"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._clients.get(ip)
+            if state is None:
+                state = self._clients[ip] = [TokenBucket(self.client_rate), 0, now]
+            state[1] += 1
+            state[2] = now
+            if now - self._last_prune > RATE_CLIENT_IDLE:
+                self._last_prune = now
+                for key in [k for k, s in self._clients.items() if not s[1] and now - s[2] > RATE_CLIENT_IDLE]:
+                    del self._clients[key]
+            bucket = state[0]
+        return _TransferLimiter(self, (self.global_bucket, self.route_buckets[route], bucket), ip)
+
+    def release(self, limiter):
+        with self._lock:
+            state = self._clients.get(limiter.ip)
+            if state is not None:
+                state[1] -= 1
+                state[2] = time.monotonic()
+
+    def active_transfers(self):
+        """各客户端进行中的受限传输数：{ip: n}"""
+        with self._lock:
+            return {ip: s[1] for ip, s in self._clients.items() if s[1]}
+
+# 全局带宽整形
+bandwidth = BandwidthShaper()
+
+class AdmissionController:
+    """
+    重负载请求（打包下载、上传）的准入控制：
+    - 每类请求有并发上限，超出时进入该类的等待队列，最多等待 ADMISSION_WAIT 秒；
+    - 等待队列已满（queue_size 为0时不等待）、等待超时，或重负载请求（含等待中的）将占满工作线程时，立即拒绝（503）；
+    - 进行中与等待中的重负载请求合计不超过工作线程数扣除 ADMISSION_RESERVE_FRACTION 后的名额，
+      空闲长连接在等待区中不占工作线程；普通文件下载不受准入控制，不计入。
+    按客户端IP记录进行中与等待中的任务数，供 /clients 展示。
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.limits = {'zip': ADMISSION_MAX_ZIP, 'upload': ADMISSION_MAX_UPLOAD}
+        self.queue_size = ADMISSION_QUEUE
+        self.capacity = MAX_WORKERS
+        self._active = dict.fromkeys(self.limits, 0)
+        self._waiting = dict.fromkeys(self.limits, 0)
+        self.rejected = dict.fromkeys(self.limits, 0)
+        self._clients = {}  # ip -> {kind: [进行中, 等待中]}
+
+    def set_workers(self, workers):
+        with self._cond:
+            self.capacity = max(1, workers - max(1, int(workers * ADMISSION_RESERVE_FRACTION)))
+            self._cond.notify_all()
+
+    def configure(self, limits, queue_size):
+        with self._cond:
+            self.limits.update(limits)
+            self.queue_size = queue_size
+            self._cond.notify_all()
+
+    def admit(self, kind, ip, timeout=ADMISSION_WAIT):
+        """获得执行名额返回True；队列已满或等待超时返回False"""
+        with self._cond:
+            occupied = sum(self._active.values()) + sum(self._waiting.values())
+            if occupied >= self.capacity:
+                self.rejected[kind] += 1
+                return False
+            if self._waiting[kind] or self._active[kind] >= self.limits[kind]:
+                # 先到先等，不插队
+                if self._waiting[kind] >= self.queue_size:
+                    self.rejected[kind] += 1
+                    return False
+                deadline = time.monotonic() + timeout
+                self._waiting[kind] += 1
+                self._client(ip, kind)[1] += 1
+                try:
+                    while self._active[kind] >= self.limits[kind]:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected[kind] += 1
+                            return False
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting[kind] -= 1
+                    self._client(ip, kind)[1] -= 1
+                    self._drop_idle(ip)
+            self._active[kind] += 1
+            self._client(ip, kind)[0] += 1
+            return True
+
+    def release(self, kind, ip):
+        with self._cond:
+            self._active[kind] -= 1
+            self._client(ip, kind)[0] -= 1
+            self._drop_idle(ip)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """(各类进行中数, 各类等待数, 各类拒绝数, {ip: {kind: {'active', 'queued'}}})"""
+        with self._cond:
+            clients = {ip: {kind: {'active': c[0], 'queued': c[1]} for kind, c in jobs.items() if c[0] or c[1]}
+                       for ip, jobs in self._clients.items()}
+            return dict(self._active), dict(self._waiting), dict(self.rejected), clients
+
+    def _client(self, ip, kind):
+        jobs = self._clients.setdefault(ip, {})
+        return jobs.setdefault(kind, [0, 0])
+
+    def _drop_idle(self, ip):
+        jobs = self._clients.get(ip)
+        if jobs is not None and not any(c[0] or c[1] for c in jobs.values()):
+            del self._clients[ip]
+
+# 全局准入控制
+admission = AdmissionController()
+
+def request_route(method, path):
+    # 将请求归类为有限的路由标签，避免按原始路径统计导致标签无限增长
+    if method == 'DELETE':
+        return 'upload_session' if path.startswith('/upload/session/') else 'delete'
+    if path.startswith('/upload/session'):
+        return 'upload_session'
+    if path in ('/list', '/upload', '/clients', '/config', '/login', '/newfolder', '/metrics'):
+        return path[1:]
+    if path.startswith('/port/'):
+        return 'port'
+    if path.endswith('.zip'):
+        return 'zip'
+    if path in ('/', '/webserver.html') or path.startswith('/image/'):
+        return 'static'
+    return 'file' if method in ('GET', 'HEAD') else 'other'
+
+def metric_method(command):
+    # 客户端可任意填写请求方法，按固定集合归类，避免标签无限增长
+    return command if command in METRICS_METHODS else 'other'
+
+def metric_label(value):
+    # Prometheus 标签值转义：反斜杠、双引号、换行
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class ServerMetrics:
+    """
+    服务运行指标，/metrics 以 Prometheus 文本格式输出。
+    每个请求结束时只做一次加锁的计数累加，可常开。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}      # (route, method, status) -> 次数
+        self.latency = {}       # route -> [各桶计数..., 总和, 总数]
+        self.bytes_out = {}     # route -> 字节
+        self.bytes_in = {}      # route -> 字节
+        self.in_flight = 0
+        self.zip_active = 0
+        self.logins = {}        # result -> 次数
+        self.rejected = 0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, route, method, status, seconds, bytes_in, bytes_out):
+        i = bisect.bisect_left(METRICS_LATENCY_BUCKETS, seconds)
+        with self._lock:
+            self.in_flight -= 1
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            hist = self.latency.get(route)
+            if hist is None:
+                hist = self.latency[route] = [0] * (len(METRICS_LATENCY_BUCKETS) + 2)
+            if i < len(METRICS_LATENCY_BUCKETS):
+                hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+            self.bytes_out[route] = self.bytes_out.get(route, 0) + bytes_out
+            self.bytes_in[route] = self.bytes_in.get(route, 0) + bytes_in
+
+    def zip_started(self):
+        with self._lock:
+            self.zip_active += 1
+
+    def zip_finished(self):
+        with self._lock:
+            self.zip_active -= 1
+
+    def login(self, result):
+        with self._lock:
+            self.logins[result] = self.logins.get(result, 0) + 1
+
+    def rejected_busy(self):
+        with self._lock:
+            self.rejected += 1
+
+    def render(self):
+        """生成 Prometheus 文本格式（exposition format 0.0.4）"""
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {k: list(v) for k, v in self.latency.items()}
+            bytes_out = dict(self.bytes_out)
+            bytes_in = dict(self.bytes_in)
+            in_flight, zip_active, rejected = self.in_flight, self.zip_active, self.rejected
+            logins = dict(self.logins)
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_str = ','.join(f'{k}="{metric_label(v)}"' for k, v in labels)
+                lines.append(f'{name}{{{label_str}}} {value}' if label_str else f'{name} {value}')
+
+        metric('fileshare_requests_total', 'counter', 'HTTP requests by route, method and status.',
+               [((('route', r), ('method', m), ('status', s)), n) for (r, m, s), n in sorted(requests.items(), key=str)])
+        lines.append('# HELP fileshare_request_duration_seconds Request latency from request line to last byte.')
+        lines.append('# TYPE fileshare_request_duration_seconds histogram')
+        for route, hist in sorted(latency.items()):
+            route = metric_label(route)
+            cumulative = 0
+            for bound, count in zip(METRICS_LATENCY_BUCKETS, hist):
+                cumulative += count
+                lines.append(f'fileshare_request_duration_seconds_bucket{{route="{route}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'fileshare_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {hist[-1]}')
+            lines.append(f'fileshare_request_duration_seconds_sum{{route="{route}"}} {hist[-2]:.6f}')
+            lines.append(f'fileshare_request_duration_seconds_count{{route="{route}"}} {hist[-1]}')
+        metric('fileshare_sent_bytes_total', 'counter', 'Response bytes sent, including headers.',
+               [((('route', r),), n) for r, n in sorted(bytes_out.items())])
+        metric('fileshare_received_bytes_total', 'counter', 'Request bytes received, including headers.',
+               [((('route', r),), n) for r, n in sorted(bytes_in.items())])
+        metric('fileshare_requests_in_flight', 'gauge', 'Requests currently being handled.', [((), in_flight)])
+        metric('fileshare_zip_jobs_active', 'gauge', 'Zip downloads currently streaming.', [((), zip_active)])
+        metric('fileshare_login_attempts_total', 'counter', 'Login attempts by result.',
+               [((('result', r),), n) for r, n in sorted(logins.items())])
+        metric('fileshare_rejected_connections_total', 'counter', 'Connections answered 503 because the request queue was full.',
+               [((), rejected)])
+        active, queued, rejected_jobs, _ = admission.snapshot()
+        metric('fileshare_jobs_active', 'gauge', 'Admitted zip and upload jobs.',
+               [((('route', k),), n) for k, n in sorted(active.items())])
+        metric('fileshare_jobs_queued', 'gauge', 'Zip and upload jobs waiting for admission.',
+               [((('route', k),), n) for k, n in sorted(queued.items())])
+        metric('fileshare_jobs_rejected_total', 'counter', 'Zip and upload jobs answered 503 by admission control.',
+               [((('route', k),), n) for k, n in sorted(rejected_jobs.items())])
+        metric('fileshare_auth_sessions_active', 'gauge', 'Logged-in browser sessions.', [((), len(auth_sessions))])
+        metric('fileshare_upload_sessions_active', 'gauge', 'Open resumable upload sessions.', [((), len(upload_sessions))])
+        metric('fileshare_access_log_dropped_total', 'counter', 'Access log records dropped because the writer fell behind.',
+               [((), access_log.dropped)])
+        metric('fileshare_uptime_seconds', 'gauge', 'Seconds since the process started.', [((), round(time.time() - self.started, 3))])
+        return '\n'.join(lines) + '\n'
+
+# 全局运行指标
+metrics = ServerMetrics()
+
+class DirListingCache:
+    """
+    目录列表缓存，供 /list 分页使用。
+    - 每个目录保存一份条目快照 (名称, 是否目录, 字节数, mtime)，按目录mtime与短TTL重新验证；
+    - 每种排序/过滤组合的排序结果单独缓存，翻页时只做二分定位与切片；
+    - 排序结果始终为升序，降序时从尾部倒序取页。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._views = OrderedDict()
+
+    def entries(self, abs_dir):
+        mtime_ns = os.stat(abs_dir).st_mtime_ns
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(abs_dir)
+            if cached is not None and cached[0] == mtime_ns and now - cached[1] < LIST_CACHE_TTL:
+                self._entries.move_to_end(abs_dir)
+                return cached[2]
+        entries = []
+        share_root = FileServer.get_share_path()
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                if is_upload_part(entry.name):
+                    continue
+                # 指向共享目录之外的符号链接不列出（访问时 safe_path 同样会拒绝）
+                if entry.is_symlink() and not path_resolver.contains(share_root, entry.path):
+                    continue
+                try:
+                    if entry.is_dir():
+                        size = dir_size_index.get_size(entry.path)
+                        entries.append((entry.name, True, size, entry.stat().st_mtime))
+                    else:
+                        st = entry.stat()
+                        entries.append((entry.name, False, st.st_size, st.st_mtime))
+                except OSError:
+                    pass
+        entries = tuple(entries)
+        with self._lock:
+            self._entries[abs_dir] = (mtime_ns, now, entries)
+            self._entries.move_to_end(abs_dir)
+            while len(self._entries) > LIST_CACHE_DIRS:
+                self._entries.popitem(last=False)
+        return entries
+
+    @staticmethod
+    def sort_key(entry, sort, desc):
+        # 主键相同时按名称排序，保证顺序确定；降序视图倒序读取，分组键相应取反使文件夹始终在前
+        name, is_dir, size, mtime = entry
+        value = {'name': name.lower(), 'size': size, 'mtime': mtime}[sort]
+        return (is_dir if desc else not is_dir, value, name)
+
+    def view(self, abs_dir, sort, desc, q, exts):
+        """返回 (排序键列表, 条目列表)，按 sort_key 升序排列并按 q/exts 过滤"""
+        entries = self.entries(abs_dir)
+        key = (abs_dir, sort, desc, q, exts)
+        with self._lock:
+            cached = self._views.get(key)
+            if cached is not None and cached[0] is entries:
+                self._views.move_to_end(key)
+                return cached[1], cached[2]
+        items = entries
+        if q:
+            items = [e for e in items if q in e[0].lower()]
+        if exts:
+            items = [e for e in items if not e[1] and os.path.splitext(e[0])[1][1:].lower() in exts]
+        keyed = sorted((self.sort_key(e, sort, desc), e) for e in items)
+        keys = [k for k, e in keyed]
+        items = [e for k, e in keyed]
+        with self._lock:
+            self._views[key] = (entries, keys, items)
+            while len(self._views) > LIST_CACHE_VIEWS:
+                self._views.popitem(last=False)
+        return keys, items
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._views.clear()
+
+# 全局目录列表缓存
+dir_listing_cache = DirListingCache()
+
+class PathResolver:
+    """
+    请求路径 -> 共享目录内绝对路径的解析与越权检查，结果按原始请求路径缓存（LRU）。
+    - 按 realpath 解析符号链接与 ..，再按路径分段判断是否位于根目录内（/share2 不属于 /share）；
+    - 返回未解析链接的绝对路径，与目录索引等使用的路径保持一致；
+    - 根目录变化时清空缓存；缓存条目 PATH_CACHE_TTL 秒后重新解析，以反映链接变化；
+    - contains 供遍历目录（打包、列表、大小索引）逐项检查符号链接，不经缓存。
+    """
+    def __init__(self, capacity=PATH_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # 原始路径 -> (解析时间, 绝对路径或None)
+        self._root = None
+        self._real_root = None
+
+    def resolve(self, root, rel_path):
+        """越权或非法路径返回None"""
+        now = time.monotonic()
+        with self._lock:
+            real_root = self._switch_root(root)
+            hit = self._items.get(rel_path)
+            if hit is not None and now - hit[0] < PATH_CACHE_TTL:
+                self._items.move_to_end(rel_path)
+                return hit[1]
+        abs_path = os.path.abspath(os.path.join(root, unquote(rel_path)))
+        if not self._inside(real_root, abs_path):
+            abs_path = None
+        with self._lock:
+            if root == self._root:
+                self._items[rel_path] = (now, abs_path)
+                self._items.move_to_end(rel_path)
+                while len(self._items) > self.capacity:
+                    self._items.popitem(last=False)
+        return abs_path
+
+    def contains(self, root, abs_path):
+        """abs_path 解析符号链接后是否仍位于 root 内"""
+        with self._lock:
+            real_root = self._switch_root(root)
+        return self._inside(real_root, abs_path)
+
+    def _switch_root(self, root):
+        # 调用方持有锁；根目录变化时清空缓存
+        if root != self._root:
+            self._items.clear()
+            self._root = root
+            self._real_root = os.path.normcase(os.path.realpath(root))
+        return self._real_root
+
+    @staticmethod
+    def _inside(real_root, abs_path):
+        try:
+            real = os.path.normcase(os.path.realpath(abs_path))
+        except (OSError, ValueError):
+            return False
+        prefix = real_root if real_root.endswith(os.sep) else real_root + os.sep
+        return real == real_root or real.startswith(prefix)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._root = None
+
+# 全局路径解析缓存
+path_resolver = PathResolver()
+
+def encode_list_cursor(entry, sort):
+    # 游标记录上一页最后一条的排序字段，目录内容变化时仍能从正确位置继续
+    name, is_dir, size, mtime = entry
+    raw = json.dumps([is_dir, {'name': name.lower(), 'size': size, 'mtime': mtime}[sort], name], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_list_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        is_dir, value, name = json.loads(raw.decode('utf-8'))
+        return bool(is_dir), value, str(name)
+    except (ValueError, TypeError):
+        return None
 
 class FileServer(SimpleHTTPRequestHandler):
     # 常用配置区
@@ -108,6 +2085,13 @@ class FileServer(SimpleHTTPRequestHandler):
     PASSWORD = ""
     ENABLE_LOGIN = None  # true为启用登录，false为禁用登录
     port_socket = None   # 只允许开启一个端口
+    protocol_version = 'HTTP/1.1' if HTTP_KEEP_ALIVE else 'HTTP/1.0'
+    # 响应头与响应体分两次写出：长连接上 Nagle 与延迟确认叠加会使每个请求多等约40ms，关闭 Nagle
+    disable_nagle_algorithm = True
+    KEEPALIVE_TIMEOUT = KEEPALIVE_TIMEOUT
+    KEEPALIVE_MAX_REQUESTS = KEEPALIVE_MAX_REQUESTS
+    ZIP_COMPRESS_LEVEL = ZIP_COMPRESS_LEVEL
+    UPLOAD_MAX_BYTES = UPLOAD_MAX_BYTES
 
     @staticmethod
     def check_port_available(port):
@@ -124,8 +2108,7 @@ class FileServer(SimpleHTTPRequestHandler):
     def get_share_path(cls):
         # 自动从配置文件读取共享目录
         if not cls.SHARE_DIR:
-            cfg = load_config()
-            cls.SHARE_DIR = cfg.get('dir', '')
+            cls.SHARE_DIR = config_service.get().get('dir', '')
         if not cls.SHARE_DIR:
             log_message("错误：共享目录未指定，请设置 FileServer.SHARE_DIR 类属性。")
             sys.exit(1)
@@ -135,6 +2118,254 @@ class FileServer(SimpleHTTPRequestHandler):
     def get_base_dir(cls):
         return cls.BASE_DIR
 
+    @classmethod
+    def builtin_assets(cls):
+        # 启动时预加载的内置资源：页面与 /image/ 下的图标
+        paths = [os.path.join(cls.get_base_dir(), 'webserver.html')]
+        image_dir = os.path.join(os.path.dirname(__file__), '../image')
+        try:
+            paths += [e.path for e in os.scandir(image_dir) if e.is_file()]
+        except OSError:
+            pass
+        return paths
+
+    def setup(self):
+        super().setup()
+        self.rfile = _CountingReader(self.rfile)
+        self.wfile = _CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        self._request_started = None
+        self._limiter = None
+        self._admitted = None
+        error = None
+        try:
+            super().handle_one_request()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if self._limiter is not None:
+                bandwidth.release(self._limiter)
+                self.rfile.limiter = self.wfile.limiter = self._limiter = None
+            if self._admitted is not None:
+                admission.release(self._admitted, self.client_address[0])
+            if self._request_started is not None:
+                command = self.command or '-'
+                metrics.request_finished(
+                    request_route(command, urlparse(getattr(self, 'path', '')).path), metric_method(command),
+                    self._status or 0,
+                    time.perf_counter() - self._request_started,
+                    self.rfile.bytes - self._bytes_in_base, self.wfile.bytes - self._bytes_out_base)
+                if access_log.enabled:
+                    self._write_access_log(error)
+
+    def _write_access_log(self, error=None):
+        # 一个请求一条结构化记录：字节数、首字节时间与总耗时（毫秒）
+        now = time.perf_counter()
+        first_write = self.wfile.first_write
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime()),
+            'client': self.client_address[0],
+            'method': self.command,
+            'path': unquote(self.path),
+            'status': self._status,
+            'bytes_in': self.rfile.bytes - self._bytes_in_base,
+            'bytes_out': self.wfile.bytes - self._bytes_out_base,
+            'ttfb_ms': round((first_write - self._request_started) * 1000, 3) if first_write else None,
+            'duration_ms': round((now - self._request_started) * 1000, 3),
+        }
+        if getattr(self, '_transfer_mode', None):
+            record['mode'] = self._transfer_mode
+        if error is not None:
+            record['error'] = type(error).__name__
+        access_log.write(record)
+
+    def log_request(self, code='-', size='-'):
+        self._status = code.value if hasattr(code, 'value') else code
+        super().log_request(code, size)
+
+    def __init__(self, request, client_address, server, served=0):
+        # served: 该连接此前已处理的请求数（连接从空闲等待区交回时传入）
+        self.served = served
+        self.idle = False
+        super().__init__(request, client_address, server)
+
+    def handle(self):
+        """
+        按连接循环处理请求，带空闲超时与单连接最大请求数限制。
+        服务对象提供空闲等待区（parker）时，读缓冲为空就结束循环并置 idle，
+        由服务把连接挂起等待下一个请求，不占用工作线程。
+        """
+        self.close_connection = True
+        self._requests_on_connection = self.served
+        parker = getattr(self.server, 'parker', None)
+        while True:
+            # 等待下一个请求期间使用空闲超时，读到请求行后恢复阻塞（见 parse_request）
+            self.connection.settimeout(self.KEEPALIVE_TIMEOUT)
+            self.handle_one_request()
+            self._requests_on_connection += 1
+            if self.close_connection or self._requests_on_connection >= self.KEEPALIVE_MAX_REQUESTS:
+                break
+            if parker is not None and not self._has_buffered_request():
+                self.idle = True
+                break
+        self.served = self._requests_on_connection
+
+    def _has_buffered_request(self):
+        # 非阻塞地查看读缓冲：客户端已发来下一个请求（如流水线）时继续在本线程处理
+        try:
+            self.connection.settimeout(0.0)
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.KEEPALIVE_TIMEOUT)
+
+    def parse_request(self):
+        # 请求行已读入：开始计时，记录本请求的字节计数起点
+        self._request_started = time.perf_counter()
+        self._bytes_in_base = self.rfile.bytes - len(self.raw_requestline)
+        self._bytes_out_base = self.wfile.bytes
+        self.wfile.first_write = None
+        self._status = None
+        self._transfer_mode = None
+        self._admission_checked = False
+        metrics.request_started()
+        ok = super().parse_request()
+        self.connection.settimeout(None)
+        self._vary = None
+        if ok:
+            if not self._admission_checked and not self._admit():
+                return False
+            # 文件下载、打包与上传参与限速（按路由与客户端IP）
+            route = request_route(self.command, urlparse(self.path).path)
+            route = 'upload' if route == 'upload_session' else route
+            if route in RATE_LIMITED_ROUTES:
+                self._limiter = bandwidth.acquire(self.client_address[0], route)
+                self.rfile.limiter = self.wfile.limiter = self._limiter
+        return ok
+
+    def handle_expect_100(self):
+        # 带 Expect: 100-continue 的上传先做准入检查，繁忙时客户端无需发送请求体
+        if not self._admit():
+            return False
+        return super().handle_expect_100()
+
+    def _admit(self):
+        # 打包下载与上传数据（表单上传、分块写入）需先获得准入名额，失败时已返回503
+        self._admission_checked = True
+        path = urlparse(self.path).path
+        if path.endswith('.zip') and self.command in ('GET', 'HEAD'):
+            kind = 'zip'
+        elif self.command == 'PUT' and path.startswith('/upload/session/') or self.command == 'POST' and path == '/upload':
+            kind = 'upload'
+        else:
+            return True
+        if not admission.admit(kind, self.client_address[0]):
+            self._reject_overloaded(kind)
+            return False
+        self._admitted = kind
+        return True
+
+    def _reject_overloaded(self, kind):
+        # 准入失败：立即返回503与Retry-After，未读取的请求体无法跳过，关闭连接
+        log_message(f"服务繁忙，拒绝{kind}请求: {self.client_address[0]} {unquote(self.path)}")
+        self.close_connection = True
+        self.send_json({'error': 'busy', 'route': kind, 'retryAfter': ADMISSION_RETRY_AFTER}, 503,
+                       {'Retry-After': str(ADMISSION_RETRY_AFTER)})
+        length = self.headers.get('Content-Length', '')
+        if length.isdigit():
+            self._drain_rejected_body(int(length))
+
+    def _drain_rejected_body(self, length):
+        """
+        先关闭发送方向，再在限定字节数与时间内读取丢弃请求体（lingering close）。
+        直接关闭带未读数据的套接字会发出RST，客户端仍在发送时只看到连接被重置。
+        """
+        try:
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_WR)
+            self.connection.settimeout(ADMISSION_DRAIN_SECONDS)
+            deadline = time.monotonic() + ADMISSION_DRAIN_SECONDS
+            remaining = min(length, ADMISSION_DRAIN_MAX)
+            while remaining > 0 and time.monotonic() < deadline:
+                data = self.rfile.read1(min(remaining, RATE_CHUNK_SIZE))
+                if not data:
+                    break
+                remaining -= len(data)
+        except OSError:
+            pass
+
+    def end_headers(self):
+        # 按 Accept-Encoding 协商过的响应需声明 Vary，避免缓存把压缩版本发给不支持的客户端
+        if getattr(self, '_vary', None):
+            self.send_header('Vary', self._vary)
+        # 长连接上的最后一个请求主动告知客户端关闭；
+        # 单线程引擎没有空闲等待区，一个空闲连接就会挡住所有人，因此不保持连接
+        if (self.request_version == 'HTTP/1.1' and self.protocol_version == 'HTTP/1.1'
+                and not self.close_connection
+                and (getattr(self, '_requests_on_connection', 0) + 1 >= self.KEEPALIVE_MAX_REQUESTS
+                     or getattr(self.server, 'parker', None) is None)):
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    def log_error(self, format, *args):
+        # 长连接空闲超时属于正常关闭，不记录
+        if format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+    def send_error(self, code, message=None, explain=None):
+        # 状态行只能使用latin-1编码，中文说明改放到响应体中
+        if message and not message.isascii():
+            explain = explain or message
+            message = None
+        super().send_error(code, message, explain)
+
+    def send_json(self, obj, status=200, extra_headers=None):
+        """发送JSON响应（带Content-Length，保证长连接分帧正确）"""
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_body(body, 'application/json', status, extra_headers)
+
+    def send_body(self, body, content_type, status=200, extra_headers=None):
+        """发送内存中的响应体，客户端支持时按 Accept-Encoding 压缩"""
+        self._vary = 'Accept-Encoding'
+        encoding = None
+        if len(body) >= COMPRESS_MIN_SIZE and is_compressible(content_type):
+            encoding = choose_encoding(self.headers.get('Accept-Encoding', ''))
+        if encoding:
+            body = compress_bytes(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_stream(self, content_type, extra_headers=None):
+        """
+        开始一个长度未知的流式响应：HTTP/1.1 客户端使用分块编码，
+        其它情况以关闭连接标记结束。返回可写对象，结束后需调用 finish_stream。
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        chunked = self.request_version == 'HTTP/1.1' and self.protocol_version == 'HTTP/1.1'
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        return ChunkedWriter(self.wfile, chunked)
+
+    def finish_stream(self, out):
+        out.close()
+
     def do_GET(self):
         path = urlparse(self.path).path
         query = urlparse(self.path).query
@@ -142,36 +2373,37 @@ class FileServer(SimpleHTTPRequestHandler):
         if path.startswith('/image/'):
             img_name = unquote(path[len('/image/'):])
             img_path = os.path.join(os.path.dirname(__file__), '../image', img_name)
-            if os.path.isfile(img_path):
-                self.send_response(200)
-                self.send_header('Content-Type', self.guess_type(img_path))
-                self.send_header('Content-Length', os.path.getsize(img_path))
-                self.end_headers()
-                with open(img_path, 'rb') as f:
-                    shutil.copyfileobj(f, self.wfile)
+            if os.path.isfile(img_path):
+                self.send_static(img_path, CACHE_CONTROL_IMAGE)
                 return
         if path == '/list':
             self.handle_list()
+        elif path.startswith('/upload/session/'):
+            self.handle_upload_session_status(self._upload_session_id(path))
         elif path == '/clients':
             self.handle_clients()
+        elif path == '/metrics':
+            self.handle_metrics()
         elif path == '/config':
             self.handle_config()
         elif path.startswith('/port/'):
             action = path.split('/')[-1]
             self.handle_port_action(action)
         elif path.endswith('.zip'):
-            self.handle_zip_download(path)
+            metrics.zip_started()
+            try:
+                self.handle_zip_download(path)
+            finally:
+                metrics.zip_finished()
         else:
             # 优先尝试共享目录文件下载，支持中文路径
             rel_path = unquote(path.lstrip('/'))
             abs_path = self.safe_path(rel_path)
-            if abs_path and os.path.isfile(abs_path):
-                self.send_response(200)
-                self.send_header('Content-Type', self.guess_type(abs_path))
-                self.send_header('Content-Length', os.path.getsize(abs_path))
-                self.end_headers()
-                with open(abs_path, 'rb') as f:
-                    shutil.copyfileobj(f, self.wfile)
+            if abs_path is None:
+                # safe_path 已回复403
+                return
+            if os.path.isfile(abs_path):
+                self.send_file(abs_path)
             else:
                 self.serve_static()
 
@@ -179,17 +2411,23 @@ class FileServer(SimpleHTTPRequestHandler):
         path = urlparse(self.path).path
         if path == '/upload':
             self.handle_upload()
+        elif path == '/upload/session':
+            self.handle_upload_session_create()
+        elif path.startswith('/upload/session/') and path.endswith('/complete'):
+            self.handle_upload_session_complete(self._upload_session_id(path))
         elif path == '/newfolder':
             self.handle_newfolder()
         elif path == '/login':
             self.handle_login()
         else:
+            # 未读取的请求体会破坏长连接，直接关闭
+            self.close_connection = True
             self.send_error(404)
     def handle_login(self):
         # 支持以下逻辑：
         # - 如果登录未启用（ENABLE_LOGIN False），始终返回 success=True（无需记录）
-        # - 如果该IP已在 logged_in_ips 且未过期（10分钟内），直接视为已认证
-        # - 否则按提交的 password 字段验证，验证成功则记录该IP的登录时间
+        # - 如果请求携带的会话Cookie仍有效（10分钟内有访问），直接视为已认证并顺延
+        # - 否则按提交的 password 字段验证，验证成功则新建会话并下发Cookie
         client_ip = self.client_address[0]
         length = int(self.headers.get('Content-Length', 0))
         data = self.rfile.read(length)
@@ -197,53 +2435,62 @@ class FileServer(SimpleHTTPRequestHandler):
             obj = json.loads(data.decode('utf-8'))
             password = obj.get('password', '')
         except Exception:
-            self.send_response(400)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': False, 'error': 'Invalid request'}, ensure_ascii=False).encode('utf-8'))
+            self.send_json({'success': False, 'error': 'Invalid request'}, 400)
             return
 
         # 如果登录被禁用
         if not self.ENABLE_LOGIN:
+            metrics.login('disabled')
             log_message(f"登录禁用，{client_ip} 无需密码直接访问")
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True}, ensure_ascii=False).encode('utf-8'))
+            self.send_json({'success': True})
             return
 
-        # 清理过期登录记录
-        now = time.time()
-        expired = [ip for ip, ts in logged_in_ips.items() if now - ts > AUTH_TTL]
-        for ip in expired:
-            try:
-                del logged_in_ips[ip]
-            except KeyError:
-                pass
-
-        # 如果客户端已在登录列表且未过期，直接认证成功
-        if client_ip in logged_in_ips:
-            log_message(f"免登录验证通过: {client_ip}（{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(logged_in_ips[client_ip]))}）")
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True}, ensure_ascii=False).encode('utf-8'))
+        # 如果会话仍有效，直接认证成功
+        token = self._session_token()
+        if auth_sessions.touch(token):
+            metrics.login('remembered')
+            log_message(f"免登录验证通过: {client_ip}")
+            self.send_json({'success': True}, extra_headers=self._session_cookie(token))
             return
 
         # 否则按密码验证
         success = (password == self.PASSWORD)
+        metrics.login('success' if success else 'failure')
         if success:
-            logged_in_ips[client_ip] = now
-            log_message(f"登录成功: {client_ip} at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}")
+            token = auth_sessions.create(client_ip)
+            log_message(f"登录成功: {client_ip} at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
+            self.send_json({'success': True}, extra_headers=self._session_cookie(token))
         else:
             log_message(f"登录失败: {client_ip} (尝试密码: {password})")
+            self.send_json({'success': False})
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps({'success': success}, ensure_ascii=False).encode('utf-8'))
+    def _session_token(self):
+        # 从Cookie中取出会话令牌
+        cookie = SimpleCookie()
+        try:
+            cookie.load(self.headers.get('Cookie', ''))
+        except CookieError:
+            return None
+        morsel = cookie.get(SESSION_COOKIE)
+        return morsel.value if morsel else None
+
+    def _session_cookie(self, token):
+        # 每次认证成功都重新下发，浏览器端有效期随服务端一起顺延
+        return {'Set-Cookie': f'{SESSION_COOKIE}={token}; Max-Age={auth_sessions.ttl}; Path=/; HttpOnly; SameSite=Lax'}
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        if path.startswith('/upload/session/'):
+            self.handle_upload_chunk(self._upload_session_id(path))
+        else:
+            self.close_connection = True
+            self.send_error(404)
 
     def do_DELETE(self):
+        path = urlparse(self.path).path
+        if path.startswith('/upload/session/'):
+            self.handle_upload_session_abort(self._upload_session_id(path))
+            return
         # 支持删除子目录下文件/文件夹
         rel_path = unquote(self.path.lstrip('/'))
         abs_path = self.safe_path(rel_path)
@@ -251,10 +2498,12 @@ class FileServer(SimpleHTTPRequestHandler):
             return
         if os.path.isfile(abs_path):
             os.remove(abs_path)
+            dir_size_index.invalidate(os.path.dirname(abs_path))
             self.send_response(204)
             self.end_headers()
         elif os.path.isdir(abs_path):
             shutil.rmtree(abs_path)
+            dir_size_index.invalidate(abs_path)
             self.send_response(204)
             self.end_headers()
         else:
@@ -266,14 +2515,216 @@ class FileServer(SimpleHTTPRequestHandler):
         if rel_path == '' or rel_path == 'webserver.html':
             abs_path = os.path.join(self.get_base_dir(), 'webserver.html')
         if os.path.isfile(abs_path):
-            self.send_response(200)
-            self.send_header('Content-Type', self.guess_type(abs_path))
-            self.send_header('Content-Length', os.path.getsize(abs_path))
-            self.end_headers()
-            with open(abs_path, 'rb') as f:
-                shutil.copyfileobj(f, self.wfile)
+            self.send_static(abs_path)
+        else:
+            self.send_error(404)
+
+    def send_static(self, abs_path, cache_control=CACHE_CONTROL_DEFAULT):
+        """
+        发送页面、图标等静态资源：小文件直接从内存缓存发送，
+        可压缩类型按 Accept-Encoding 返回缓存的预压缩内容；大文件或带 Range 的请求按普通文件发送。
+        """
+        ctype = self.guess_type(abs_path)
+        compressible = is_compressible(ctype)
+        if compressible:
+            self._vary = 'Accept-Encoding'
+        try:
+            asset, st = static_asset_cache.get(abs_path)
+        except OSError:
+            self.send_error(404)
+            return
+        if asset is None or self.headers.get('Range'):
+            self.send_file(abs_path, cache_control)
+            return
+        encoding = None
+        if compressible and st.st_size >= COMPRESS_MIN_SIZE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding', ''))
+        etag = make_etag(st)
+        body = asset.data
+        if encoding:
+            # 不同编码是不同的字节序列，强ETag需区分
+            etag = etag[:-1] + f'-{encoding}"'
+            body = static_asset_cache.encoded(abs_path, asset, encoding)
+        last_modified = self.date_time_string(int(st.st_mtime))
+        if self.is_not_modified(etag, int(st.st_mtime)):
+            self.send_not_modified(etag, last_modified, cache_control)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
         else:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, abs_path, cache_control=CACHE_CONTROL_DEFAULT):
+        """
+        发送文件内容，支持 Range / If-Range：
+        单段返回206，多段返回 multipart/byteranges，范围无效返回416。
+        支持条件请求：If-None-Match / If-Modified-Since 命中时返回304。
+        """
+        try:
+            f = open(abs_path, 'rb')
+        except OSError:
             self.send_error(404)
+            return
+        self._transfer_bytes = 0
+        self._transfer_mode = None
+        started = time.perf_counter()
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            ctype = self.guess_type(abs_path)
+            last_modified = self.date_time_string(int(st.st_mtime))
+            etag = make_etag(st)
+            if self.is_not_modified(etag, int(st.st_mtime)):
+                self.send_not_modified(etag, last_modified, cache_control)
+                return
+            ranges = None
+            if self.headers.get('Range') and self._if_range_matches(etag, last_modified):
+                ranges = parse_range_header(self.headers.get('Range'), size)
+                if ranges == []:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+            if not ranges:
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(size))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                self.copy_file_range(f, 0, size)
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.send_response(206)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                self.copy_file_range(f, start, end - start + 1)
+            else:
+                # 多段：先生成各段头部，以便预先计算总长度
+                boundary = uuid.uuid4().hex
+                parts = []
+                for start, end in ranges:
+                    head = (f'\r\n--{boundary}\r\n'
+                            f'Content-Type: {ctype}\r\n'
+                            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode('latin-1')
+                    parts.append((head, start, end))
+                tail = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+                total = sum(len(head) + end - start + 1 for head, start, end in parts) + len(tail)
+                self.send_response(206)
+                self.send_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+                self.send_header('Content-Length', str(total))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Last-Modified', last_modified)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                for head, start, end in parts:
+                    self.wfile.write(head)
+                    self.copy_file_range(f, start, end - start + 1)
+                self.wfile.write(tail)
+        self._log_transfer(abs_path, started)
+
+    def _log_transfer(self, abs_path, started):
+        # 记录本次响应发送的字节数、耗时与速率，便于对比sendfile与缓冲复制
+        if self._transfer_bytes < TRANSFER_LOG_MIN_BYTES:
+            return
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        rate = self._transfer_bytes / elapsed / 1024 / 1024
+        log_message(f"发送完成: {os.path.basename(abs_path)} {self._transfer_bytes} 字节，"
+                    f"用时 {elapsed:.3f}s，{rate:.1f} MB/s，方式 {self._transfer_mode}")
+
+    def _if_range_matches(self, etag, last_modified):
+        # 无If-Range时总是按Range处理；有If-Range时需强ETag或日期完全一致才按Range处理
+        if_range = self.headers.get('If-Range')
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return not etag.startswith('W/') and if_range == etag
+        return if_range == last_modified
+
+    def is_not_modified(self, etag, mtime=None):
+        """
+        判断条件请求是否命中缓存。If-None-Match 优先（弱比较），
+        不存在时才使用 If-Modified-Since。
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            if if_none_match.strip() == '*':
+                return True
+            candidates = [t.strip() for t in if_none_match.split(',')]
+            bare = etag[2:] if etag.startswith('W/') else etag
+            return any((t[2:] if t.startswith('W/') else t) == bare for t in candidates)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since and mtime is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return mtime <= since
+        return False
+
+    def send_not_modified(self, etag, last_modified=None, cache_control=CACHE_CONTROL_DEFAULT):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+
+    def copy_file_range(self, f, offset, length):
+        """
+        从文件offset处发送length字节到客户端。
+        明文socket连接走 socket.sendfile（内核零拷贝），其它连接（如SSL）回退到缓冲复制。
+        """
+        if length <= 0:
+            return
+        sock = self.connection
+        if USE_SENDFILE and hasattr(os, 'sendfile') and type(sock) is socket.socket:
+            # 先把已缓冲的响应头/分段头写出，保证字节顺序
+            self.wfile.flush()
+            limiter = self.wfile.limiter
+            sent = 0
+            while sent < length:
+                n = length - sent
+                if limiter is not None and limiter.active:
+                    # 限速时按分片发送
+                    n = min(n, RATE_CHUNK_SIZE)
+                    limiter.throttle(n)
+                n = sock.sendfile(f, offset + sent, n)
+                if not n:
+                    break
+                sent += n
+                self.wfile.count(n)
+            self._transfer_mode = 'sendfile'
+        else:
+            f.seek(offset)
+            sent = 0
+            while sent < length:
+                chunk = f.read(min(COPY_BUFSIZE, length - sent))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+            self._transfer_mode = 'copy'
+        self._transfer_bytes = getattr(self, '_transfer_bytes', 0) + sent
 
     def handle_list(self):
         # 支持访问子目录，默认根目录
@@ -281,43 +2732,95 @@ class FileServer(SimpleHTTPRequestHandler):
         params = dict([kv.split('=') for kv in query.split('&') if '=' in kv])
         rel_dir = params.get('dir', '').strip()
         abs_dir = self.safe_path(rel_dir) if rel_dir else self.get_share_path()
-        if abs_dir is None or not os.path.isdir(abs_dir):
+        if abs_dir is None:
+            return
+        if not os.path.isdir(abs_dir):
             self.send_error(404)
             return
-        items = []
-        for entry in os.scandir(abs_dir):
-            if entry.is_dir():
-                folder_size = self.get_folder_size(os.path.join(abs_dir, entry.name))
-                size_str = f"{round(folder_size/1024,2)} KB" if folder_size < 1024*1024 else f"{round(folder_size/1024/1024,2)} MB"
-                items.append({
-                    'name': entry.name,
-                    'isFolder': True,
-                    'canOpen': True,
-                    'size': size_str  # 文件夹大小
-                })
-            else:
-                size = round(entry.stat().st_size / 1024, 2)
-                items.append({
-                    'name': entry.name,
-                    'size': f"{size} KB" if size < 1024 else f"{round(size/1024,2)} MB",
-                    'isFolder': False,
-                    'canOpen': False
-                })
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(items, ensure_ascii=False).encode('utf-8'))
+        paged = any(k in params for k in ('offset', 'limit', 'cursor', 'sort', 'order', 'q', 'ext'))
+        if not paged:
+            # 未带分页参数：保持原有的数组格式
+            body = json.dumps([self._list_item(e) for e in dir_listing_cache.entries(abs_dir)], ensure_ascii=False)
+        else:
+            result = self._list_page(abs_dir, params)
+            if result is None:
+                return
+            body = json.dumps(result, ensure_ascii=False)
+        body = body.encode('utf-8')
+        # 列表的ETag由目录当前状态（条目名称、大小）生成，内容未变时轮询返回304
+        etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()[:24]
+        if self.is_not_modified(etag):
+            self._vary = 'Accept-Encoding'
+            self.send_not_modified(etag)
+            return
+        self.send_body(body, 'application/json', extra_headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL_DEFAULT})
+
+    def _list_page(self, abs_dir, params):
+        """
+        分页列表：sort=name|size|mtime，order=asc|desc，q=名称关键字，ext=扩展名（逗号分隔），
+        offset/limit 或 cursor（上一页返回的 nextCursor）翻页。参数非法时已返回400并返回None。
+        """
+        sort = params.get('sort', 'name')
+        order = params.get('order', 'asc')
+        limit = params.get('limit', str(LIST_PAGE_DEFAULT))
+        offset = params.get('offset', '0')
+        if sort not in ('name', 'size', 'mtime') or order not in ('asc', 'desc') \
+                or not limit.isdigit() or not offset.isdigit():
+            self.send_error(400, "Invalid list parameters")
+            return None
+        limit = max(1, min(int(limit), LIST_PAGE_MAX))
+        q = unquote(params.get('q', '')).strip().lower()
+        exts = frozenset(x.strip().lstrip('.').lower() for x in unquote(params.get('ext', '')).split(',') if x.strip())
+        desc = order == 'desc'
+        keys, items = dir_listing_cache.view(abs_dir, sort, desc, q, exts)
+        if params.get('cursor'):
+            cursor = decode_list_cursor(params['cursor'])
+            if cursor is None:
+                self.send_error(400, "Invalid cursor")
+                return None
+            is_dir, value, name = cursor
+            key = (is_dir if desc else not is_dir, value, name)
+            try:
+                # 游标之后的位置：升序取其右侧，降序取其左侧
+                pos = bisect.bisect_left(keys, key) if desc else bisect.bisect_right(keys, key)
+            except TypeError:
+                self.send_error(400, "Invalid cursor")
+                return None
+            start = len(items) - pos if desc else pos
+        else:
+            start = int(offset)
+        if desc:
+            end = max(len(items) - start, 0)
+            page = items[max(end - limit, 0):end][::-1]
+        else:
+            page = items[start:start + limit]
+        next_cursor = encode_list_cursor(page[-1], sort) if page and start + limit < len(items) else None
+        return {
+            'items': [self._list_item(e) for e in page],
+            'total': len(items),
+            'offset': start,
+            'limit': limit,
+            'sort': sort,
+            'order': order,
+            'nextCursor': next_cursor,
+        }
+
+    @staticmethod
+    def _list_item(entry):
+        # size 为显示用字符串（兼容旧页面），bytes/mtime 为原始数值
+        name, is_dir, size, mtime = entry
+        return {
+            'name': name,
+            'isFolder': is_dir,
+            'canOpen': is_dir,
+            'size': f"{round(size/1024,2)} KB" if size < 1024*1024 else f"{round(size/1024/1024,2)} MB",
+            'bytes': size,
+            'mtime': mtime,
+        }
 
     def get_folder_size(self, folder):
-        total = 0
-        for root, dirs, files in os.walk(folder):
-            for f in files:
-                fp = os.path.join(root, f)
-                try:
-                    total += os.path.getsize(fp)
-                except Exception:
-                    pass
-        return total
+        # 由目录大小索引直接给出，避免每次请求都遍历子目录
+        return dir_size_index.get_size(folder)
 
     def handle_upload(self):
         # 支持上传到子目录，参数dir
@@ -325,28 +2828,217 @@ class FileServer(SimpleHTTPRequestHandler):
         params = dict([kv.split('=') for kv in query.split('&') if '=' in kv])
         rel_dir = params.get('dir', '').strip()
         target_dir = self.safe_path(rel_dir) if rel_dir else self.get_share_path()
-        if target_dir is None or not os.path.isdir(target_dir):
+        if target_dir is None:
+            # 请求体未读取，不能继续复用连接
+            self.close_connection = True
+            return
+        if not os.path.isdir(target_dir):
             self.send_error(400, "目标目录不存在")
             return
-        ctype, pdict = cgi.parse_header(self.headers.get('Content-Type'))
-        if ctype == 'multipart/form-data':
-            pdict['boundary'] = bytes(pdict['boundary'], "utf-8")
-            pdict['CONTENT-LENGTH'] = int(self.headers.get('Content-Length'))
-            form = cgi.FieldStorage(fp=self.rfile, headers=self.headers, environ={'REQUEST_METHOD':'POST'}, keep_blank_values=True)
-            fileitem = form['file']
-            if fileitem.filename:
-                save_path = os.path.join(target_dir, fileitem.filename)
-                if not self.safe_path(os.path.relpath(save_path, self.get_share_path())):
-                    self.send_error(403, "禁止越权上传")
-                    return
-                with open(save_path, 'wb') as f:
-                    shutil.copyfileobj(fileitem.file, f)
-                self.send_response(204)
-                self.end_headers()
-            else:
-                self.send_error(400, "No file")
-        else:
+        ctype, pdict = parse_header_params(self.headers.get('Content-Type', ''))
+        if ctype != 'multipart/form-data' or not pdict.get('boundary'):
+            self.close_connection = True
             self.send_error(400, "Invalid form")
+            return
+        length = self.headers.get('Content-Length', '')
+        if not length.isdigit():
+            self.close_connection = True
+            self.send_error(411, "Length Required")
+            return
+        if int(length) > self.UPLOAD_MAX_BYTES:
+            self.close_connection = True
+            self.send_error(413, "上传内容超出大小限制")
+            return
+        reader = MultipartReader(self.rfile, pdict['boundary'].encode('utf-8'), int(length))
+        saved = []
+        save_path = None
+        try:
+            # 每个带文件名的分段直接写入最终位置，支持一次上传多个文件
+            for part in reader:
+                if not part.filename:
+                    continue
+                save_path = self.upload_target(target_dir, part.filename)
+                if not save_path:
+                    if save_path is None:
+                        self.close_connection = True
+                        return
+                    continue
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                with open(save_path, 'wb') as f:
+                    part.stream_to(f.write)
+                saved.append(save_path)
+                save_path = None
+        except (MultipartError, OSError) as e:
+            # 写了一半的文件没有意义，删除
+            if save_path and os.path.isfile(save_path):
+                try:
+                    os.remove(save_path)
+                except OSError:
+                    pass
+            log_message(f"上传失败: {self.client_address[0]} {e}")
+            self.close_connection = True
+            self.send_error(400, "Upload failed")
+            return
+        finally:
+            for d in {os.path.dirname(p) for p in saved}:
+                dir_size_index.invalidate(d)
+        if not saved:
+            self.send_error(400, "No file")
+            return
+        self.send_response(204)
+        self.end_headers()
+
+    def upload_target(self, target_dir, filename):
+        """
+        由上传文件名得到保存路径。文件名可带相对路径（如上传文件夹时的 a/b/c.jpg），
+        保存到 target_dir 下对应子目录。文件名为空返回''，越权时已返回403并返回None。
+        """
+        parts = [p for p in filename.replace('\\', '/').split('/') if p not in ('', '.')]
+        if not parts:
+            return ''
+        if '..' in parts:
+            self.send_error(403, "禁止访问目录之外的路径")
+            return None
+        save_path = os.path.join(target_dir, *parts)
+        if not self.safe_path(os.path.relpath(save_path, self.get_share_path())):
+            return None
+        return save_path
+
+    @staticmethod
+    def _upload_session_id(path):
+        return path[len('/upload/session/'):].split('/')[0]
+
+    def handle_upload_session_create(self):
+        # 创建（或找回）分块上传会话，参数dir，请求体 {"name", "size", "fingerprint"}
+        query = urlparse(self.path).query
+        params = dict([kv.split('=') for kv in query.split('&') if '=' in kv])
+        rel_dir = params.get('dir', '').strip()
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length)
+        target_dir = self.safe_path(rel_dir) if rel_dir else self.get_share_path()
+        if target_dir is None:
+            return
+        if not os.path.isdir(target_dir):
+            self.send_error(400, "目标目录不存在")
+            return
+        try:
+            obj = json.loads(data.decode('utf-8'))
+            name = str(obj.get('name', '')).strip()
+            size = int(obj.get('size', -1))
+            fingerprint = str(obj.get('fingerprint', ''))
+        except (ValueError, AttributeError):
+            self.send_error(400, "Invalid session")
+            return
+        if not name or size < 0:
+            self.send_error(400, "Invalid session")
+            return
+        if size > self.UPLOAD_MAX_BYTES:
+            self.send_error(413, "上传内容超出大小限制")
+            return
+        save_path = self.upload_target(target_dir, name)
+        if not save_path:
+            if save_path == '':
+                self.send_error(400, "Invalid session")
+            return
+        try:
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            session = upload_sessions.create(save_path, size, fingerprint)
+        except OSError as e:
+            log_message(f"创建上传会话失败: {self.client_address[0]} {e}")
+            self.send_error(500, "Create session failed")
+            return
+        self.send_json(session.to_dict())
+
+    def handle_upload_session_status(self, sid):
+        # 查询会话已收到的区间，客户端据此续传
+        session = upload_sessions.get(sid)
+        if session is None:
+            self.send_error(404, "Unknown session")
+            return
+        with session.lock:
+            info = session.to_dict()
+        self.send_json(info)
+
+    def handle_upload_chunk(self, sid):
+        # 按 offset 将请求体写入临时文件的对应位置，分块可乱序、并发、重复发送
+        session = upload_sessions.get(sid)
+        if session is None:
+            self.close_connection = True
+            self.send_error(404, "Unknown session")
+            return
+        query = urlparse(self.path).query
+        params = dict([kv.split('=') for kv in query.split('&') if '=' in kv])
+        offset = params.get('offset', '')
+        length = self.headers.get('Content-Length', '')
+        if not length.isdigit():
+            self.close_connection = True
+            self.send_error(411, "Length Required")
+            return
+        offset, length = int(offset) if offset.isdigit() else -1, int(length)
+        if length > UPLOAD_SESSION_MAX_CHUNK:
+            self.close_connection = True
+            self.send_error(413, "分块超出大小限制")
+            return
+        if offset < 0 or offset + length > session.size:
+            self.close_connection = True
+            self.send_error(416, "分块超出文件范围")
+            return
+        written = 0
+        try:
+            with open(session.part_path, 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    data = self.rfile.read(min(UPLOAD_CHUNK_SIZE, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+        except OSError as e:
+            log_message(f"分块写入失败: {self.client_address[0]} {e}")
+            self.close_connection = True
+            self.send_error(409, "Session closed")
+            return
+        if written < length:
+            # 连接中断：只写了一部分的分块不计入，由客户端重传
+            self.close_connection = True
+            return
+        with session.lock:
+            session.add_range(offset, offset + length)
+            received = session.received_bytes()
+        self.send_json({'received': received})
+
+    def handle_upload_session_complete(self, sid):
+        # 全部分块到齐后原子改名为目标文件
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        session = upload_sessions.get(sid)
+        if session is None:
+            self.send_error(404, "Unknown session")
+            return
+        with session.lock:
+            if not session.complete():
+                self.send_json(dict(session.to_dict(), error='incomplete'), 409)
+                return
+            try:
+                os.replace(session.part_path, session.path)
+            except OSError as e:
+                log_message(f"上传完成改名失败: {self.client_address[0]} {e}")
+                self.send_error(500, "Upload failed")
+                return
+        upload_sessions.remove(sid, delete_part=False)
+        dir_size_index.invalidate(os.path.dirname(session.path))
+        log_message(f"分块上传完成: {self.client_address[0]} {os.path.relpath(session.path, self.get_share_path())} {session.size}B")
+        self.send_response(204)
+        self.end_headers()
+
+    def handle_upload_session_abort(self, sid):
+        # 放弃上传，删除临时文件
+        if upload_sessions.remove(sid) is None:
+            self.send_error(404, "Unknown session")
+            return
+        self.send_response(204)
+        self.end_headers()
 
     def handle_newfolder(self):
         # 支持在任意子目录新建文件夹，参数dir
@@ -368,9 +3060,9 @@ class FileServer(SimpleHTTPRequestHandler):
                 folder_path = os.path.join(self.get_share_path(), name)
             # 检查是否越权
             if not self.safe_path(os.path.relpath(folder_path, self.get_share_path())):
-                self.send_error(403, "禁止越权新建")
                 return
             os.makedirs(folder_path, exist_ok=True)
+            dir_size_index.invalidate(os.path.dirname(os.path.abspath(folder_path)))
             self.send_response(204)
             self.end_headers()
         except Exception:
@@ -384,6 +3076,8 @@ class FileServer(SimpleHTTPRequestHandler):
             return
         folder_rel = zip_path[:-4]  # 去掉.zip
         abs_folder = self.safe_path(folder_rel)
+        if abs_folder is None:
+            return
         # 生成zip文件名，避免中文导致header异常
         zip_name = os.path.basename(folder_rel) + '.zip'
         # RFC 6266: 使用Content-Disposition的filename*参数支持中文
@@ -391,32 +3085,135 @@ class FileServer(SimpleHTTPRequestHandler):
         # 如果有非ASCII字符，添加filename*参数
         if any(ord(c) > 127 for c in zip_name):
             disposition += f"; filename*=UTF-8''{self._url_quote(zip_name)}"
-        # 如果是文件夹则打包整个文件夹
+        # 如果是文件夹则打包整个文件夹（按相对路径排序，保证多次请求的归档布局一致）
         if abs_folder and os.path.isdir(abs_folder):
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/zip')
-            self.send_header('Content-Disposition', disposition)
-            self.end_headers()
-            with zipfile.ZipFile(self.wfile, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
-                for root, dirs, files in os.walk(abs_folder):
-                    for file in files:
-                        abs_file = os.path.join(root, file)
-                        rel_file = os.path.relpath(abs_file, abs_folder)
-                        with open(abs_file, 'rb') as f:
-                            zf.writestr(rel_file, f.read())
-            return
+            files = []
+            share_root = self.get_share_path()
+            for root, dirs, names in os.walk(abs_folder):
+                dirs.sort()
+                for file in sorted(names):
+                    if is_upload_part(file):
+                        continue
+                    abs_file = os.path.join(root, file)
+                    # os.walk 不进入符号链接目录，但会列出链接文件：指向共享目录之外的跳过
+                    if os.path.islink(abs_file) and not path_resolver.contains(share_root, abs_file):
+                        continue
+                    files.append((abs_file, os.path.relpath(abs_file, abs_folder)))
         # 如果是PDF文件则只打包该文件
-        if abs_folder and os.path.isfile(abs_folder) and abs_folder.lower().endswith('.pdf'):
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/zip')
-            self.send_header('Content-Disposition', disposition)
-            self.end_headers()
-            with zipfile.ZipFile(self.wfile, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
-                with open(abs_folder, 'rb') as f:
-                    zf.writestr(os.path.basename(abs_folder), f.read())
+        elif abs_folder and os.path.isfile(abs_folder) and abs_folder.lower().endswith('.pdf'):
+            files = [(abs_folder, os.path.basename(abs_folder))]
+        else:
+            # 其它情况404
+            self.send_error(404)
             return
-        # 其它情况404
-        self.send_error(404)
+        query = urlparse(self.path).query
+        params = dict([kv.split('=', 1) for kv in query.split('&') if '=' in kv])
+        entries = []
+        stored_bytes = total_bytes = 0
+        for abs_file, rel_file in files:
+            try:
+                st = os.stat(abs_file)
+            except OSError as e:
+                log_message(f"打包跳过文件: {rel_file} ({e})")
+                continue
+            entries.append((rel_file, abs_file, st.st_size, st.st_mtime_ns))
+            total_bytes += st.st_size
+            # 只按扩展名估算，不读文件内容，首字节无需等待
+            if self.ZIP_COMPRESS_LEVEL <= 0 or os.path.splitext(abs_file)[1].lower() in ZIP_STORED_EXTENSIONS:
+                stored_bytes += st.st_size
+        # 客户端要求store=1，或内容几乎都是已压缩数据时，预先规划存储模式布局，给出精确长度并支持续传
+        if params.get('store') == '1' or stored_bytes >= total_bytes * ZIP_STORE_AUTO_RATIO:
+            self.send_stored_zip(StoredZipPlan(entries), disposition)
+            return
+        out = self.start_stream('application/zip', {'Content-Disposition': disposition})
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+                             compresslevel=self.ZIP_COMPRESS_LEVEL, strict_timestamps=False) as zf:
+            for rel_file, abs_file, size, mtime_ns in entries:
+                self._zip_write_file(zf, abs_file, rel_file)
+        self.finish_stream(out)
+
+    def send_stored_zip(self, plan, disposition):
+        """按预先规划的布局发送仅存储模式zip，支持单段Range与If-Range"""
+        last_modified = self.date_time_string(plan.mtime)
+        start, end = 0, plan.size - 1
+        status = 200
+        if self.headers.get('Range') and self._if_range_matches(plan.etag, last_modified):
+            ranges = parse_range_header(self.headers.get('Range'), plan.size)
+            if ranges == []:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{plan.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if ranges and len(ranges) == 1:
+                start, end = ranges[0]
+                status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', disposition)
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{plan.size}')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', plan.etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self._transfer_bytes = 0
+        index = bisect.bisect_right(plan.starts, start) - 1
+        for seg_start, length, kind, arg in plan.segments[index:]:
+            if seg_start > end:
+                break
+            lo = max(start, seg_start) - seg_start
+            hi = min(end, seg_start + length - 1) - seg_start + 1
+            if kind == 'bytes':
+                self.wfile.write(arg[lo:hi])
+            elif kind == 'descriptor':
+                self.wfile.write(plan._descriptor(arg)[lo:hi])
+            elif kind == 'central':
+                self.wfile.write(plan.central_directory()[lo:hi])
+            elif not self._send_zip_member(plan, arg, lo, hi - lo):
+                # 文件在规划后被修改，已发送的长度无法兑现，只能中断连接
+                log_message(f"打包文件已变化，中断下载: {plan.entries[arg][0]}")
+                self.close_connection = True
+                return
+
+    def _send_zip_member(self, plan, i, offset, length):
+        arcname, abs_path, size, mtime_ns = plan.entries[i]
+        try:
+            f = open(abs_path, 'rb')
+        except OSError:
+            return False
+        with f:
+            if os.fstat(f.fileno()).st_size != size:
+                return False
+            if plan.crcs[i] is not None or offset != 0 or length != size:
+                # CRC已知或只发送部分数据：直接零拷贝发送
+                self.copy_file_range(f, offset, length)
+                return True
+            # 完整顺序发送：边发送边计算CRC
+            crc = 0
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(ZIP_CHUNK_SIZE, remaining))
+                if not chunk:
+                    return False
+                crc = zlib.crc32(chunk, crc)
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+            plan.remember_crc(i, crc)
+        return True
+
+    def _zip_write_file(self, zf, abs_file, arcname):
+        """
+        写入单个成员：写入前才抽样决定压缩方式，前面的成员已在发送中；
+        zipfile 分块读取并压缩，峰值内存与文件大小无关，压缩级别取自 ZipFile 的 compresslevel。
+        """
+        compress_type = zip_compress_type(abs_file, self.ZIP_COMPRESS_LEVEL)
+        try:
+            zf.write(abs_file, arcname, compress_type)
+        except (FileNotFoundError, PermissionError) as e:
+            # 只可能发生在读取文件信息或打开文件时，此时尚未写出该成员的任何数据
+            log_message(f"打包跳过文件: {arcname} ({e})")
 
     def _url_quote(self, s):
         # RFC 5987编码，供filename*使用
@@ -426,26 +3223,14 @@ class FileServer(SimpleHTTPRequestHandler):
 
     def handle_config(self):
         # 返回是否需要登录，由本地配置决定
-        # 同时返回当前请求IP是否已认证（在登录保持期内）
-        client_ip = self.client_address[0]
-        # 清理过期登录记录
-        now = time.time()
-        expired = [ip for ip, ts in logged_in_ips.items() if now - ts > AUTH_TTL]
-        for ip in expired:
-            try:
-                del logged_in_ips[ip]
-            except KeyError:
-                pass
-
-        authenticated = client_ip in logged_in_ips
+        # 同时返回当前会话是否已认证（在登录保持期内），已认证则顺延有效期
+        token = self._session_token()
+        authenticated = auth_sessions.touch(token)
         config = {
             "enableLogin": bool(self.ENABLE_LOGIN),
-            "authenticated": bool(authenticated)
+            "authenticated": authenticated
         }
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(config, ensure_ascii=False).encode('utf-8'))
+        self.send_json(config, extra_headers=self._session_cookie(token) if authenticated else None)
 
     @staticmethod
     def check_port_available(port):
@@ -479,16 +3264,10 @@ class FileServer(SimpleHTTPRequestHandler):
                     s.listen(1)
                     FileServer.port_socket = s
                 except Exception as e:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({'port': port, 'available': False, 'error': str(e)}, ensure_ascii=False).encode('utf-8'))
+                    self.send_json({'port': port, 'available': False, 'error': str(e)})
                     return
             result = self.check_port(port)
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'port': port, 'available': result}, ensure_ascii=False).encode('utf-8'))
+            self.send_json({'port': port, 'available': result})
         elif action == 'open':
             if FileServer.port_socket is not None:
                 self.send_error(400, "Port already opened")
@@ -498,28 +3277,16 @@ class FileServer(SimpleHTTPRequestHandler):
                 s.bind(('0.0.0.0', port))
                 s.listen(1)
                 FileServer.port_socket = s
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'port': port, 'opened': True}, ensure_ascii=False).encode('utf-8'))
+                self.send_json({'port': port, 'opened': True})
             except Exception as e:
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'port': port, 'opened': False, 'error': str(e)}, ensure_ascii=False).encode('utf-8'))
+                self.send_json({'port': port, 'opened': False, 'error': str(e)})
         elif action == 'close':
             if FileServer.port_socket is not None:
                 FileServer.port_socket.close()
                 FileServer.port_socket = None
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'closed': True}, ensure_ascii=False).encode('utf-8'))
+                self.send_json({'closed': True})
             else:
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'closed': False, 'error': 'No port opened'}, ensure_ascii=False).encode('utf-8'))
+                self.send_json({'closed': False, 'error': 'No port opened'})
         else:
             self.send_error(404)
 
@@ -529,14 +3296,10 @@ class FileServer(SimpleHTTPRequestHandler):
         return abs_path
 
     def safe_path(self, rel_path):
-        # 只允许访问SHARE_DIR及其子目录，rel_path，防止中文或特殊字符导致路径不一致
-        rel_path_decoded = unquote(rel_path)
-        abs_path = os.path.abspath(os.path.join(self.get_share_path(), rel_path_decoded))
-        share_root = os.path.abspath(self.get_share_path())
-        #print(f"safe_path: abs_path={abs_path}, share_root={share_root}")
-        if not abs_path.startswith(share_root):
+        # 只允许访问SHARE_DIR及其子目录（解析符号链接后按路径分段判断），越权时返回403
+        abs_path = path_resolver.resolve(self.get_share_path(), rel_path)
+        if abs_path is None:
             self.send_error(403, "禁止访问目录之外的路径")
-            return None
         return abs_path
 
     def log_message(self, format, *args):
@@ -572,44 +3335,374 @@ class FileServer(SimpleHTTPRequestHandler):
         )
         # 更新全局最后访问时间（ISO格式）
         try:
-            client_last_seen[self.client_address[0]] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+            with _state_lock:
+                client_last_seen[self.client_address[0]] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
         except Exception:
             pass
         log_message(msg)
 
+    def handle_metrics(self):
+        # Prometheus 文本格式指标
+        self.send_body(metrics.render().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8',
+                       extra_headers={'Cache-Control': 'no-store'})
+
     def handle_clients(self):
         """
-        返回已见客户端IP及最后访问时间的JSON数组，格式: [{"ip":"192.168.x.x","lastSeen":"YYYY-MM-DD HH:MM:SS"}, ...]
+        返回已见客户端IP及最后访问时间的JSON数组，格式: [{"ip":"192.168.x.x","lastSeen":"YYYY-MM-DD HH:MM:SS","jobs":{...}}, ...]
         """
         try:
             items = []
-            for ip, ts in client_last_seen.items():
-                items.append({'ip': ip, 'lastSeen': ts})
+            jobs = admission.snapshot()[3]
+            with _state_lock:
+                seen = dict(client_last_seen)
+            for ip in seen.keys() | jobs.keys():
+                # jobs: 该客户端进行中/等待中的打包与上传任务，如 {"zip": {"active": 1, "queued": 0}}
+                items.append({'ip': ip, 'lastSeen': seen.get(ip, ''), 'jobs': jobs.get(ip, {})})
             # 按最后访问时间降序
             items.sort(key=lambda x: x.get('lastSeen', ''), reverse=True)
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(items, ensure_ascii=False).encode('utf-8'))
+            self.send_json(items)
         except Exception:
             self.send_error(500, 'Internal Server Error')
 
 
-import threading
+# 队列已满时直接写回的最小503响应
+_BUSY_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                  b"Retry-After: 1\r\n"
+                  b"Content-Length: 0\r\n"
+                  b"Connection: close\r\n\r\n")
+
+def _reject_busy(request, parker=None):
+    # 服务繁忙：立即回复503，避免客户端无限等待。
+    # 请求尚未读取，直接 close 会因接收缓冲区有数据而发 RST，客户端可能收不到503；
+    # 因此先关闭发送方向，再交给等待区读掉剩余请求数据后关闭，不阻塞 accept 线程
+    metrics.rejected_busy()
+    try:
+        request.sendall(_BUSY_RESPONSE)
+        request.shutdown(socket.SHUT_WR)
+    except OSError:
+        request.close()
+        return
+    if parker is None or not parker.linger(request):
+        request.close()
+
+class IdleConnectionParker:
+    """
+    空闲长连接的等待区：连接在两次请求之间不占用工作线程，
+    由一个 selector 线程统一监听，可读时交回 dispatch 分配工作线程，超时则关闭。
+    dispatch(conn, client_address, served) 由服务对象提供，served 为该连接已处理的请求数。
+    已回复503的连接也可交给 linger，在此读掉剩余数据直到对端关闭或超时。
+    """
+    def __init__(self, dispatch):
+        self._dispatch = dispatch
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conns = {}  # conn -> (client_address, served, deadline)；linger 的连接 client_address 为 None，served 为剩余可读字节数
+        self._closed = False
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name="fileserver-idle", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conns) + len(self._pending)
+
+    def park(self, conn, client_address, served=0, timeout=KEEPALIVE_TIMEOUT):
+        """挂起连接等待下一个请求；等待区已满或已关闭时返回 False，由调用方自行处理"""
+        with self._lock:
+            if self._closed or len(self._conns) + len(self._pending) >= IDLE_MAX_CONNECTIONS:
+                return False
+            self._pending.append((conn, client_address, served, time.monotonic() + timeout))
+        self._wake()
+        return True
+
+    def linger(self, conn):
+        """接管已关闭发送方向的连接，读掉剩余数据后关闭；等待区已满或已关闭时返回 False"""
+        try:
+            conn.setblocking(False)
+        except OSError:
+            return False
+        return self.park(conn, None, ADMISSION_DRAIN_MAX, ADMISSION_DRAIN_SECONDS)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                closed = self._closed
+                pending, self._pending = self._pending, []
+            for conn, client_address, served, deadline in pending:
+                try:
+                    self._selector.register(conn, selectors.EVENT_READ)
+                except (ValueError, OSError):
+                    conn.close()
+                    continue
+                self._conns[conn] = (client_address, served, deadline)
+            if closed:
+                break
+            now = time.monotonic()
+            timeout = min((d for _, _, d in self._conns.values()), default=now + 60) - now
+            for key, _ in self._selector.select(max(0.0, timeout)):
+                conn = key.fileobj
+                if conn is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                client_address, served, deadline = self._conns[conn]
+                if client_address is None:
+                    # 已拒绝的连接：丢弃数据，对端关闭或读满上限后再关闭
+                    try:
+                        data = conn.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''
+                    if data and len(data) < served:
+                        self._conns[conn] = (None, served - len(data), deadline)
+                        continue
+                    self._selector.unregister(conn)
+                    del self._conns[conn]
+                    conn.close()
+                    continue
+                self._selector.unregister(conn)
+                del self._conns[conn]
+                self._dispatch(conn, client_address, served)
+            now = time.monotonic()
+            for conn in [c for c, (_, _, d) in self._conns.items() if d <= now]:
+                # 空闲超时：直接关闭
+                self._selector.unregister(conn)
+                del self._conns[conn]
+                conn.close()
+        for conn in list(self._conns):
+            self._selector.unregister(conn)
+            conn.close()
+        self._conns.clear()
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+class PoolHTTPServer(HTTPServer):
+    """
+    线程池HTTP服务：固定数量的工作线程处理连接，等待队列有界。
+    慢速下载只占用一个工作线程，不会阻塞 /list、/config 等其它请求。
+    """
+    def __init__(self, server_address, handler_class, workers=MAX_WORKERS, queue_size=REQUEST_QUEUE_SIZE):
+        # listen 积压队列与工作线程加等待队列一致；默认的5会在连接突增时丢SYN，客户端重传要等1秒
+        self.request_queue_size = workers + queue_size
+        super().__init__(server_address, handler_class)
+        self._requests = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        for i in range(workers):
+            th = threading.Thread(target=self._worker, name=f"fileserver-{i}", daemon=True)
+            th.start()
+            self._workers.append(th)
+        self.parker = IdleConnectionParker(self._dispatch)
+
+    def process_request(self, request, client_address):
+        # 新连接先进入等待区，请求到达后才分配工作线程
+        if not self.parker.park(request, client_address, 0, FileServer.KEEPALIVE_TIMEOUT):
+            self._dispatch(request, client_address, 0)
+
+    def _dispatch(self, request, client_address, served):
+        try:
+            self._requests.put_nowait((request, client_address, served))
+        except queue.Full:
+            log_message(f"服务繁忙，拒绝连接: {client_address[0]}")
+            _reject_busy(request, self.parker)
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            request, client_address, served = item
+            handler = None
+            try:
+                handler = self.RequestHandlerClass(request, client_address, self, served=served)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if not (handler is not None and handler.idle
+                        and self.parker.park(request, client_address, handler.served, FileServer.KEEPALIVE_TIMEOUT)):
+                    self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.parker.close()
+        # 丢弃尚未处理的连接，并通知工作线程退出
+        while True:
+            try:
+                item = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for _ in self._workers:
+            try:
+                self._requests.put_nowait(None)
+            except queue.Full:
+                break
+
+class AsyncioHTTPServer:
+    """
+    asyncio 引擎：事件循环负责接受连接，连接经有界队列交给工作线程处理。
+    对外提供与 HTTPServer 相同的 serve_forever / shutdown / server_close 接口。
+    """
+    def __init__(self, server_address, handler_class, workers=MAX_WORKERS, queue_size=REQUEST_QUEUE_SIZE):
+        self.server_address = server_address
+        self.RequestHandlerClass = handler_class
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(server_address)
+            self.socket.listen(workers + queue_size)
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.setblocking(False)
+        self._requests = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        for i in range(workers):
+            th = threading.Thread(target=self._worker, name=f"fileserver-{i}", daemon=True)
+            th.start()
+            self._workers.append(th)
+        self.parker = IdleConnectionParker(self._dispatch)
+        self._loop = None
+        self._stop = None
+        self._stopped = threading.Event()
+
+    def serve_forever(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._stopped.set()
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        self._stop = loop.create_future()
+        while not self._stop.done():
+            accept = asyncio.ensure_future(loop.sock_accept(self.socket))
+            await asyncio.wait([accept, self._stop], return_when=asyncio.FIRST_COMPLETED)
+            if not accept.done():
+                accept.cancel()
+                break
+            try:
+                conn, client_address = accept.result()
+            except OSError:
+                continue
+            conn.setblocking(True)
+            if not self.parker.park(conn, client_address, 0, FileServer.KEEPALIVE_TIMEOUT):
+                self._dispatch(conn, client_address, 0)
+
+    def _dispatch(self, conn, client_address, served):
+        try:
+            self._requests.put_nowait((conn, client_address, served))
+        except queue.Full:
+            log_message(f"服务繁忙，拒绝连接: {client_address[0]}")
+            _reject_busy(conn, self.parker)
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            conn, client_address, served = item
+            handler = None
+            try:
+                handler = self.RequestHandlerClass(conn, client_address, self, served=served)
+            except Exception as e:
+                log_message(f"请求处理异常: {client_address[0]} {e}")
+            finally:
+                if not (handler is not None and handler.idle
+                        and self.parker.park(conn, client_address, handler.served, FileServer.KEEPALIVE_TIMEOUT)):
+                    try:
+                        conn.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    conn.close()
+
+    def shutdown(self):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(lambda: self._stop.done() or self._stop.set_result(None))
+            self._stopped.wait(5)
+
+    def server_close(self):
+        self.socket.close()
+        self.parker.close()
+        for _ in self._workers:
+            try:
+                self._requests.put_nowait(None)
+            except queue.Full:
+                break
+
+def create_httpd(port, engine=None, workers=None, queue_size=None):
+    """
+    按配置创建HTTP服务对象。
+    :param engine: 'pool' | 'asyncio' | 'single'
+    """
+    engine = engine or SERVER_ENGINE
+    workers = workers or MAX_WORKERS
+    queue_size = queue_size or REQUEST_QUEUE_SIZE
+    admission.set_workers(1 if engine == 'single' else workers)
+    if engine == 'asyncio':
+        return AsyncioHTTPServer(('0.0.0.0', port), FileServer, workers, queue_size)
+    if engine == 'single':
+        return HTTPServer(('0.0.0.0', port), FileServer)
+    return PoolHTTPServer(('0.0.0.0', port), FileServer, workers, queue_size)
+
 _server_thread = None
 _httpd = None
+# start_server 传入的配置覆盖项，配置文件变化时仍然生效
+_config_overrides = {}
 
-def start_server():
+def _on_config_changed(old, new):
+    # 配置文件变化：服务运行中时在线应用性能参数（目录、端口、密码仍由 refresh_all 处理）
+    if _httpd is None:
+        return
+    if any(old.get(k) != new.get(k) for k in set(old) | set(new) if k not in CONFIG_GUI_KEYS):
+        cfg = dict(new)
+        cfg.update(_config_overrides)
+        _apply_tuning(cfg)
+        log_message("配置文件已变化，已应用新的性能参数")
+
+def start_server(overrides=None):
     """
     启动WebServer服务（非阻塞，自动读取配置文件，适合外部调用）。
+    :param overrides: 可选dict，覆盖配置文件中的同名项（如基准测试指定dir、port）
     """
-    global _server_thread, _httpd
+    global _server_thread, _config_overrides
+    config_service.reload()
+    config_service.start()
+    config_service.subscribe(_on_config_changed)
     cfg = load_config()
+    _config_overrides = {k: str(v) for k, v in (overrides or {}).items()}
+    cfg.update(_config_overrides)
     FileServer.SHARE_DIR = cfg['dir']
     FileServer.PORT = int(cfg['port']) if cfg['port'].isdigit() else 8000
     FileServer.PASSWORD = cfg['password']
     FileServer.ENABLE_LOGIN = (cfg['pw_enabled'] == '1')
-    
+    engine = cfg.get('engine', SERVER_ENGINE)
+    workers = _cfg_int(cfg, 'workers', MAX_WORKERS)
+    queue_size = _cfg_int(cfg, 'queue', REQUEST_QUEUE_SIZE)
+    _apply_tuning(cfg)
+
     def run():
         global _httpd
         os.chdir(FileServer.get_base_dir())
@@ -628,8 +3721,11 @@ def start_server():
         log_message(f"本机访问: http://localhost:{FileServer.PORT}")
         log_message(f"局域网访问: http://{local_ip}:{FileServer.PORT}")
         log_message(f"服务目录: {FileServer.get_share_path()}")
+        dir_size_index.start(FileServer.get_share_path())
+        static_asset_cache.preload(FileServer.builtin_assets())
+        log_message(f"并发引擎: {engine}，工作线程 {workers}，等待队列 {queue_size}")
         try:
-            _httpd = HTTPServer(('0.0.0.0', FileServer.PORT), FileServer)
+            _httpd = create_httpd(FileServer.PORT, engine, workers, queue_size)
             _httpd.serve_forever()
         except Exception as e:
             log_message(f"服务异常终止: {e}")
@@ -663,17 +3759,24 @@ def force_stop_server():
         except Exception as e:
             log_message(f"端口socket关闭异常: {e}")
         FileServer.port_socket = None
+    dir_size_index.stop()
+    upload_sessions.clear()
+    dir_listing_cache.clear()
+    static_asset_cache.clear()
+    path_resolver.clear()
     # 清理登录和客户端记录（停止服务时清空）
     try:
-        if logged_in_ips:
-            log_message(f"清空已登录用户记录: {list(logged_in_ips.keys())}")
-        logged_in_ips.clear()
+        with _state_lock:
+            if len(auth_sessions):
+                log_message(f"清空已登录用户记录: {auth_sessions.clients()}")
+            auth_sessions.clear()
     except Exception as e:
         log_message(f"清空已登录用户记录异常: {e}")
     try:
-        if client_last_seen:
-            log_message(f"清空已见客户端记录: {list(client_last_seen.keys())}")
-        client_last_seen.clear()
+        with _state_lock:
+            if client_last_seen:
+                log_message(f"清空已见客户端记录: {list(client_last_seen.keys())}")
+            client_last_seen.clear()
     except Exception as e:
         log_message(f"清空已见客户端记录异常: {e}")
     # 关闭线程对象引用
@@ -713,5 +3816,5 @@ if __name__ == '__main__':
 # pyinstaller --onefile --icon="E:\VScode\python\wab\log.ico" --add-data "E:\VScode\python\wab\webserve\server.html;." --add-data "E:\VScode\python\wab\webserve\log.png;." E:\VScode\python\wab\webserve\serve.py
 
 # 导出接口说明:
-# - 变量: webserver_log
+# - 变量: webserver_log（LogRing，read_since(seq) 增量读取）
 # - 函数: get_log()